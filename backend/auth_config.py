@@ -1,15 +1,25 @@
+import asyncio
+import hashlib
 import os
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 
 from dotenv import load_dotenv
 from jose import jwt, JWTError
 from passlib.context import CryptContext
-from fastapi import Depends
+from fastapi import Depends, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
-from backend.database import session
+from backend.cache import TTLCache
+from backend.database import mark_recent_write, session
 import backend.models as models
 from backend.exceptions import AppException
+from backend.logging_config import request_context
+from backend.metrics import add_request_hash_time, record_password_hash
+from backend.token_revocation import TOKEN_REVOCATION_REDIS_URL, LocalTokenRevocations, RedisTokenRevocations
 from backend.enums import UserRole
 
 load_dotenv()
@@ -17,10 +27,52 @@ load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = 30  # Token expiration time set to 30 minutes
+# Verified tokens kept per worker, so a token reused on every request is only decoded once (0 = off)
+TOKEN_CACHE_MAX_SIZE = int(os.getenv("TOKEN_CACHE_MAX_SIZE", "10000"))
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+USER_CACHE_MAX_SIZE = int(os.getenv("USER_CACHE_MAX_SIZE", "1024"))
+# If true, RoleChecker trusts the role claim inside the JWT instead of the user row in DB, and routes that don't
+# need the user don't look it up at all. The claim is the role at login, so it can be stale until the token
+# expires (a role change revokes the user's tokens, but only where the revocation reaches, see token_revocation.py).
+TRUST_TOKEN_ROLE = os.getenv("TRUST_TOKEN_ROLE", "false").lower() == "true"
+
+# Password hashing config. First scheme is used for new hashes, the others are only accepted for old hashes
+# and get upgraded on next login (e.g. PASSWORD_SCHEMES=argon2,bcrypt to move to argon2).
+PASSWORD_SCHEMES = [scheme.strip() for scheme in os.getenv("PASSWORD_SCHEMES", "bcrypt").split(",") if scheme.strip()]
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+# Hashing runs in its own small thread pool (bcrypt/argon2 release the GIL), so a login burst can't
+# use up the threadpool that serves normal requests. At most HASH_WORKERS + HASH_QUEUE_LIMIT
+# hash jobs can be waiting, after that we answer 503 instead of letting latency grow forever.
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(os.cpu_count() or 2)))
+HASH_QUEUE_LIMIT = int(os.getenv("HASH_QUEUE_LIMIT", "32"))
+
+pwd_context = CryptContext(schemes=PASSWORD_SCHEMES, deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
 security = HTTPBearer(auto_error=True)
 
+hash_executor = None  # created on first use, again after stop_hash_executor() (an executor can't be restarted)
+_hash_executor_lock = threading.Lock()
+_hash_slots = threading.BoundedSemaphore(HASH_WORKERS + HASH_QUEUE_LIMIT)
+
+
+def start_hash_executor():
+    global hash_executor
+    with _hash_executor_lock:
+        if hash_executor is None:
+            hash_executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="password-hash")
+        return hash_executor
+
+
+# Drop hash jobs that haven't started and let the pool's threads exit. Safe to call more than once,
+# the next start (or hash) creates a new pool.
+def stop_hash_executor():
+    global hash_executor
+    with _hash_executor_lock:
+        executor, hash_executor = hash_executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+
 
 # Password
 def hash_password(password: str):
@@ -31,54 +83,210 @@ def verify_password(plain_password: str, hashed_password: str):
     return pwd_context.verify(plain_password, hashed_password)
 
 
+# Run a hashing function in the hash pool, or fail fast with 503 if too many are already waiting
+async def _run_in_hash_pool(operation: str, func, *args):
+    if not _hash_slots.acquire(blocking=False):
+        raise AppException("Server is busy, please try again in a moment", 503)
+
+    def timed_func():
+        started = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            record_password_hash(operation, time.perf_counter() - started)
+
+    started = time.perf_counter()
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(hash_executor or start_hash_executor(), timed_func)
+    finally:
+        _hash_slots.release()
+        add_request_hash_time(time.perf_counter() - started)  # includes time waiting for a free hash worker
+
+
+async def hash_password_async(password: str):
+    return await _run_in_hash_pool("hash", hash_password, password)
+
+
+# Hash many passwords in parallel on every hash worker (bulk user import). At most HASH_WORKERS of them
+# are queued at a time, so the pool still has room for normal logins while a big batch is running.
+async def hash_passwords_async(passwords: list[str]):
+    in_flight = asyncio.Semaphore(HASH_WORKERS)
+
+    async def hash_one(password: str):
+        async with in_flight:
+            return await hash_password_async(password)
+
+    return await asyncio.gather(*(hash_one(password) for password in passwords))
+
+
+# Returns (is_valid, new_hash). new_hash is not None when the stored hash uses old settings
+# (deprecated scheme or lower rounds) and should be saved instead of the old one.
+async def verify_and_update_password_async(plain_password: str, hashed_password: str):
+    return await _run_in_hash_pool("verify", pwd_context.verify_and_update, plain_password, hashed_password)
+
+
 # JWT
 def create_access_token(data: dict): # data is a dict that may contain user_id, username, email etc to encode in the token.
     to_encode = data.copy() # copy user data to a new dict to avoid modifying the original one
     
     # calculate the expiry time for the token
-    expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    issued = datetime.now(timezone.utc)
+    expire = issued + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
 
-    # add the expiry time to data we want to encode in token
-    to_encode.update({"exp": expire})  
+    # add the expiry time to data we want to encode in token, plus an id (to revoke this token on logout)
+    # and the issue time with sub-second precision (to revoke every token issued before a role change)
+    to_encode.update({"exp": expire, "iat": issued.timestamp(), "jti": secrets.token_urlsafe(12)})
     access_token = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return access_token
 
 
+# Payloads of tokens that passed jwt.decode, by SHA-256 of the token (fixed size keys, and no usable
+# bearer tokens sitting in memory). Each entry expires with its token, so the cache never accepts
+# an expired one. Revocation is checked on every call, cached or not.
+token_cache = TTLCache(max_size=TOKEN_CACHE_MAX_SIZE, ttl_seconds=ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+
+if TOKEN_REVOCATION_REDIS_URL:
+    token_revocations = RedisTokenRevocations(TOKEN_REVOCATION_REDIS_URL, ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+else:
+    token_revocations = LocalTokenRevocations(ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+
+
+def set_token_revocations(revocations):
+    global token_revocations
+    token_revocations = revocations
+
+
+# Called from the lifespan of every worker, see RedisTokenRevocations
+def start_token_revocations():
+    token_revocations.start()
+
+
+def stop_token_revocations():
+    token_revocations.stop()
+
+
 def verify_access_token(token: str):
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
-    except JWTError:
+    digest = hashlib.sha256(token.encode()).digest()
+    payload = token_cache.get(digest)
+
+    if payload is None:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        except JWTError:
+            return None
+        # Tokens without exp are not cached, they would never be decoded again
+        if TOKEN_CACHE_MAX_SIZE and "exp" in payload:
+            token_cache.set(digest, payload, ttl_seconds=payload["exp"] - time.time())
+
+    if token_revocations.is_revoked(payload):
         return None
+    return payload
 
 
-# Current User Dependency
-def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    token = credentials.credentials
-    payload = verify_access_token(token)
+# Logout: this one token stops working, on every worker, before it expires
+def revoke_token(payload: dict):
+    if payload.get("jti") is None:
+        # Issued before tokens had an id, the only way to end it is to end all of the user's tokens
+        revoke_user_tokens(payload["user_id"])
+    else:
+        token_revocations.revoke_token(payload["jti"], payload["exp"])
+
+
+# Role change or deletion: tokens the user already has carry the old role or a user that is gone,
+# the user has to log in again
+def revoke_user_tokens(user_id: int):
+    token_revocations.revoke_user(user_id)
+
+
+# Token Dependency, FastAPI caches it per request so the JWT is decoded only once even if several dependencies need it.
+# The rate limit middleware already decodes it to find the user, reuse that when it's the same token.
+def get_token_payload(request: Request, credentials: HTTPAuthorizationCredentials = Depends(security)):
+    decoded = getattr(request.state, "token_payload", None)
+    if decoded is not None and decoded[0] == credentials.credentials:
+        payload = decoded[1]
+    else:
+        payload = verify_access_token(credentials.credentials)
 
     if payload is None:
         raise AppException("Invalid or expired token", 401)
 
-    db = session()
-    user = db.query(models.User).filter(models.User.id == payload.get("user_id")).first()
-    db.close()
+    request.state.token_payload = (credentials.credentials, payload)
+
+    return payload
+
+
+# Process wide cache of users by id, so we don't hit the DB on every request just to re-read the same user row.
+# Routes that change a user call invalidate_user(). With several workers each one has its own cache,
+# so the TTL is the upper bound on how long another worker can see a stale user.
+user_cache = TTLCache(max_size=USER_CACHE_MAX_SIZE, ttl_seconds=USER_CACHE_TTL_SECONDS)
+
+
+def invalidate_user(user_id: int):
+    user_cache.delete(user_id)
+    mark_recent_write(f"user:{user_id}")  # the next lookup reads the changed row from the primary, not a lagging replica
+
+
+# Current User Dependency
+def get_current_user(request: Request, payload: dict = Depends(get_token_payload)):
+    # Memoize on the request so code outside the dependency system (middleware, handlers) can reuse it
+    user = getattr(request.state, "current_user", None)
+    if user is not None:
+        return user
+
+    user_id = payload.get("user_id")
+    user = user_cache.get(user_id)
 
     if user is None:
-        raise AppException("User not found", 404)
+        db = session(info={"client": f"user:{user_id}"})
+        try:
+            user = db.query(models.User).filter(models.User.id == user_id).first()
+        finally:
+            db.close()
 
+        if user is None:
+            raise AppException("User not found", 404)
+
+        user_cache.set(user_id, user)
+
+    request.state.current_user = user
+
+    # Add the user to the log context of this request
+    context = request_context.get()
+    if context is not None:
+        context["user_id"] = user.id
     return user
 
 
+# Router level dependency: the request must come from a logged in user. The user row is loaded here
+# unless TRUST_TOKEN_ROLE is set, then the token alone is enough and only the routes that need the user
+# (e.g. /users/me) load it through get_current_user.
+def require_login(request: Request, payload: dict = Depends(get_token_payload)):
+    if not TRUST_TOKEN_ROLE:
+        get_current_user(request, payload)
+        return
+
+    context = request_context.get()
+    if context is not None:
+        context["user_id"] = payload.get("user_id")
+
+
 # Role Checker Dependency to restrict access to certain endpoints based on user roles
 class RoleChecker:
     def __init__(self, allowed_roles: list[UserRole]):
         self.allowed_roles = allowed_roles
 
     # this is special method that allows us to use this class as a dependency in FastAPI routes. It will be called automatically by FastAPI when we use RoleChecker as a dependency.
-    def __call__(self, user: models.User = Depends(get_current_user)):
-        if user.role not in [role.value for role in self.allowed_roles]:
+    def __call__(self, request: Request, payload: dict = Depends(get_token_payload)):
+        if TRUST_TOKEN_ROLE:
+            # Role claim is signed by us in /auth/login, so no user lookup needed (but it can be stale, see TRUST_TOKEN_ROLE)
+            user = None
+            user_role = payload.get("role")
+        else:
+            user = get_current_user(request, payload)
+            user_role = user.role
+
+        if user_role not in [role.value for role in self.allowed_roles]:
             raise AppException("You do not have enough permissions to perform this action", 403)
         
         return user
-    
\ No newline at end of file
@@ -0,0 +1,198 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+
+from dotenv import load_dotenv
+
+from backend.jobs import enqueue_job, register_job
+from backend.json_response import dumps
+from backend.logging_config import logger
+from backend.metrics import change_feed_dropped, change_feed_subscribers
+
+load_dotenv()
+
+# Events kept in memory so a client that reconnects can catch up from its Last-Event-ID
+CHANGE_FEED_HISTORY = int(os.getenv("CHANGE_FEED_HISTORY", "1000"))
+# Events a subscriber may have waiting. A client that falls this far behind is dropped and told to reload.
+CHANGE_FEED_BUFFER = int(os.getenv("CHANGE_FEED_BUFFER", "256"))
+# Comment line sent on idle streams, keeps proxies from closing them and finds dead clients
+CHANGE_FEED_HEARTBEAT_SECONDS = float(os.getenv("CHANGE_FEED_HEARTBEAT_SECONDS", "15"))
+# Share events between workers/servers through a Redis stream, e.g. redis://localhost:6379/2
+CHANGE_FEED_REDIS_URL = os.getenv("CHANGE_FEED_REDIS_URL")
+
+# Tells the client its view may be stale (missed events, fell behind) and it should reload what it shows
+RESET_EVENT = b"event: reset\ndata: {}\n\n"
+
+
+class Subscriber:
+    def __init__(self, buffer_size: int):
+        self.queue = asyncio.Queue(maxsize=buffer_size)  # SSE frames (bytes), None = dropped
+
+
+# Fan-out of product change events to every open /products/changes stream of this worker.
+# Delivery runs on the event loop: an idle subscriber is just a coroutine waiting on its queue,
+# so thousands of them cost no threads.
+class LocalChangeFeed:
+    def __init__(self, history_size: int, buffer_size: int):
+        self.buffer_size = buffer_size
+        self.history = deque(maxlen=history_size)  # (event_id, frame)
+        self.subscribers = set()
+        self.loop = None  # event loop of the subscribers, set by the first one
+        # Ids restart with the process, the start time keeps them from matching ids of a previous run
+        self.epoch = int(time.time() * 1000)
+        self.sequence = 0
+        self.lock = threading.Lock()
+
+    # events: [(event, data)], called from the background job thread
+    def publish_many(self, events: list):
+        with self.lock:
+            numbered = []
+            for event, data in events:
+                self.sequence += 1
+                numbered.append((f"{self.epoch}-{self.sequence}", event, dumps(data)))
+        self._deliver_threadsafe(numbered)
+
+    def _deliver_threadsafe(self, events: list):
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._deliver_many, events)
+        else:
+            self._deliver_many(events)  # nobody subscribed yet, just keep the history
+
+    def _deliver_many(self, events: list):
+        for event_id, event, data in events:
+            self._deliver(event_id, event, data)
+
+    def _deliver(self, event_id: str, event: str, data: bytes):
+        frame = f"id: {event_id}\nevent: {event}\ndata: ".encode() + data + b"\n\n"
+        self.history.append((event_id, frame))
+
+        for subscriber in list(self.subscribers):
+            try:
+                subscriber.queue.put_nowait(frame)
+            except asyncio.QueueFull:
+                self._drop(subscriber)
+
+    # A client that can't keep up loses its buffered events instead of growing the queue forever
+    def _drop(self, subscriber: Subscriber):
+        self.unsubscribe(subscriber)
+        change_feed_dropped.inc()
+        while not subscriber.queue.empty():
+            subscriber.queue.get_nowait()
+        subscriber.queue.put_nowait(None)
+
+    # Returns (subscriber, frames the client missed since last_event_id). If that event is no longer
+    # in the history (too old, or from another run) the client gets a reset instead.
+    def subscribe(self, last_event_id: str | None):
+        self.loop = asyncio.get_running_loop()
+        subscriber = Subscriber(self.buffer_size)
+        self.subscribers.add(subscriber)
+        change_feed_subscribers.inc(amount=1)
+
+        if last_event_id is None:
+            return subscriber, []
+        ids = [event_id for event_id, _ in self.history]
+        if last_event_id not in ids:
+            return subscriber, [RESET_EVENT]
+        return subscriber, [frame for _, frame in list(self.history)[ids.index(last_event_id) + 1:]]
+
+    def unsubscribe(self, subscriber: Subscriber):
+        if subscriber in self.subscribers:
+            self.subscribers.discard(subscriber)
+            change_feed_subscribers.inc(amount=-1)
+
+
+# Shared backend for multi-worker deployments. Needs: pip install redis
+# Events are appended to a Redis stream (which also gives them ids every worker agrees on) and a
+# reader thread in each worker hands them to the event loop, which fans them out as above.
+class RedisChangeFeed(LocalChangeFeed):
+    STREAM_KEY = "products:changes"
+
+    def __init__(self, url: str, history_size: int, buffer_size: int):
+        import redis  # optional dependency, only needed when this backend is configured
+
+        super().__init__(history_size, buffer_size)
+        self.client = redis.Redis.from_url(url)
+        self.reader = None
+
+    # A batch of events is one round trip
+    def publish_many(self, events: list):
+        pipeline = self.client.pipeline(transaction=False)
+        for event, data in events:
+            pipeline.xadd(self.STREAM_KEY, {"event": event, "data": dumps(data)},
+                          maxlen=self.history.maxlen, approximate=True)
+        pipeline.execute()
+
+    def subscribe(self, last_event_id: str | None):
+        if self.reader is None:
+            self.reader = threading.Thread(target=self._read, name="change-feed", daemon=True)
+            self.reader.start()
+        return super().subscribe(last_event_id)
+
+    def _read(self):
+        last_id = "$"
+        while True:
+            try:
+                for _, entries in self.client.xread({self.STREAM_KEY: last_id}, block=5000) or []:
+                    last_id = entries[-1][0]
+                    self._deliver_threadsafe([
+                        (entry_id.decode(), fields[b"event"].decode(), fields[b"data"]) for entry_id, fields in entries
+                    ])
+            except Exception as e:
+                logger.warning(f"Change feed reader failed, retrying: {e}")
+                time.sleep(1)
+
+
+if CHANGE_FEED_REDIS_URL:
+    change_feed = RedisChangeFeed(CHANGE_FEED_REDIS_URL, CHANGE_FEED_HISTORY, CHANGE_FEED_BUFFER)
+else:
+    change_feed = LocalChangeFeed(CHANGE_FEED_HISTORY, CHANGE_FEED_BUFFER)
+
+
+def set_change_feed(feed):
+    global change_feed
+    change_feed = feed
+
+
+# Called by the write routes after commit. Publishing happens in the background job thread,
+# events that pile up meanwhile go out together.
+def publish_change(event: str, data: dict):
+    enqueue_job("change_feed.publish", (event, data))
+
+
+def _publish_batch(events: list):
+    change_feed.publish_many(events)
+
+
+# Events lost to a full job queue: clients can't tell what changed, so they reload everything
+def _publish_reload():
+    change_feed.publish_many([("products.reload", {})])
+
+
+register_job("change_feed.publish", _publish_batch, on_dropped=_publish_reload)
+
+
+# Body of a /products/changes response: missed events first, then live ones, with a heartbeat
+# comment whenever the stream has been quiet for CHANGE_FEED_HEARTBEAT_SECONDS
+async def stream_changes(last_event_id: str | None):
+    feed = change_feed
+    subscriber, backlog = feed.subscribe(last_event_id)
+    try:
+        yield b"retry: 3000\n\n"  # reconnect delay for EventSource
+        for frame in backlog:
+            yield frame
+
+        while True:
+            try:
+                frame = await asyncio.wait_for(subscriber.queue.get(), CHANGE_FEED_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield b": heartbeat\n\n"
+                continue
+
+            if frame is None:
+                yield RESET_EVENT
+                return
+            yield frame
+    finally:
+        feed.unsubscribe(subscriber)
@@ -1,7 +1,23 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
-from dotenv import load_dotenv
+import itertools
 import os
+import threading
+import time
+
+from sqlalchemy import MetaData, create_engine, event, inspect, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DBAPIError, TimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from sqlalchemy.schema import CreateIndex, CreateTable
+from sqlalchemy.sql.dml import UpdateBase
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
+from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
+from dotenv import load_dotenv
+
+from backend.cache import TTLCache
+from backend.logging_config import logger
 
 # Load environment variables from .env file
 load_dotenv()
@@ -11,15 +27,371 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL is not set in .env file")
 
-engine = create_engine(DATABASE_URL)
-session = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+# Opt-in async mode: routes talk to the DB through an AsyncSession (asyncpg / aiosqlite) instead of the threadpool.
+# Needs the async driver installed: pip install asyncpg (Postgres) or pip install aiosqlite (SQLite)
+DB_ASYNC = os.getenv("DB_ASYNC", "false").lower() == "true"
+
+# Connection pool settings, defaults are SQLAlchemy's except pre-ping and recycle which protect us after a DB failover
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))  # seconds to wait for a free connection
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # reconnect connections older than this (seconds), -1 = never
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"  # test a connection before using it
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))  # Postgres only, 0 = no timeout
+
+# Optional read replicas (comma separated URLs). Reads go to a replica, writes to DATABASE_URL.
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+# After a client writes, its reads go to the primary for this long so it sees its own changes despite replica lag
+REPLICA_STICKY_SECONDS = float(os.getenv("REPLICA_STICKY_SECONDS", "5"))
+# A replica that failed to connect is skipped for this long, its reads go to the other replicas or the primary
+REPLICA_RETRY_SECONDS = float(os.getenv("REPLICA_RETRY_SECONDS", "30"))
+
+
+# Counters about waiting for a pooled connection, shown by /health
+class PoolStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def record(self, wait_seconds: float, timed_out: bool = False):
+        with self.lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_seconds_total += wait_seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, wait_seconds)
+
+
+pool_stats = PoolStats()
+
+
+# Pool mixin that measures how long each checkout took: waiting for a free connection, plus opening a new
+# one or pre-pinging it. Wraps the public Pool.connect() the engine calls, not the pool's internals.
+class TimedCheckoutMixin:
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            connection = super().connect()
+        except TimeoutError:
+            pool_stats.record(time.perf_counter() - started, timed_out=True)
+            raise
+        pool_stats.record(time.perf_counter() - started)
+        return connection
+
+
+class TimedQueuePool(TimedCheckoutMixin, QueuePool):
+    pass
+
+
+class TimedAsyncQueuePool(TimedCheckoutMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def _engine_options(url: str, is_async: bool = False):
+    url = make_url(url)
+    options = {"pool_pre_ping": DB_POOL_PRE_PING}
+
+    # In-memory SQLite uses a single connection pool, the size settings don't apply to it
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        return options
+
+    options.update(
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+    )
+    options["poolclass"] = TimedAsyncQueuePool if is_async else TimedQueuePool
+
+    if url.get_backend_name() == "postgresql" and DB_STATEMENT_TIMEOUT_MS > 0:
+        # Server side timeout for every statement, so one slow query can't hold a pooled connection forever
+        if is_async:
+            options["connect_args"] = {"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}}
+        else:
+            options["connect_args"] = {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"}
+
+    return options
+
+
+engine = create_engine(DATABASE_URL, **_engine_options(DATABASE_URL))
+replica_engines = [create_engine(url, **_engine_options(url)) for url in DATABASE_REPLICA_URLS]
 
 Base = declarative_base()
 
-# Dependency to get the database session
-def get_db():
-    db = session()
+# Type of the session routes get from get_session, depends on DB_ASYNC
+AnySession = Session | AsyncSession
+
+
+# ---------------- READ REPLICAS ----------------
+
+# Clients ("user:<id>" or "ip:<address>") that wrote in the last REPLICA_STICKY_SECONDS
+_recent_writers = TTLCache(max_size=10000, ttl_seconds=REPLICA_STICKY_SECONDS)
+
+
+def mark_recent_write(client: str):
+    _recent_writers.set(client, True)
+
+
+def is_recent_writer(client: str | None):
+    return client is not None and _recent_writers.get(client, False)
+
+
+# Who a request belongs to: the logged in user once its token or user has been checked, otherwise the client address
+def request_client(request: Request):
+    user = getattr(request.state, "current_user", None)
+    if user is not None:
+        return f"user:{user.id}"
+    decoded = getattr(request.state, "token_payload", None)
+    if decoded is not None and decoded[1].get("user_id") is not None:
+        return f"user:{decoded[1]['user_id']}"
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+
+# Picks the engine a read goes to: the healthy replica with the fewest connections in use (ties take turns),
+# or the primary when every replica is down
+class ReplicaRouter:
+    def __init__(self, primary, replicas: list):
+        self.primary = primary
+        self.replicas = replicas
+        self.down_until = {}  # replica -> time.monotonic() it may be tried again
+        self.turn = itertools.count()
+
+    def candidates(self):
+        now = time.monotonic()
+        healthy = [replica for replica in self.replicas if self.down_until.get(replica, 0) <= now]
+        if not healthy:
+            return []
+        start = next(self.turn) % len(healthy)
+        healthy = healthy[start:] + healthy[:start]
+        return sorted(healthy, key=lambda replica: getattr(replica.pool, "checkedout", lambda: 0)())
+
+    def mark_down(self, replica, error: Exception):
+        if self.down_until.get(replica, 0) <= time.monotonic():
+            logger.warning(f"Replica {replica.url.render_as_string()} unavailable, reading from others for "
+                           f"{REPLICA_RETRY_SECONDS:.0f}s: {error}")
+        self.down_until[replica] = time.monotonic() + REPLICA_RETRY_SECONDS
+
+
+# Session that sends writes to the primary and reads to a replica. A session stays on the primary once it
+# has written (it must read its own transaction), and so do sessions of clients that wrote very recently.
+# Set in info: "request" (the client is taken from it), "client" (instead of a request) or "primary".
+class RoutingSession(Session):
+    router = None
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if self._flushing or isinstance(clause, UpdateBase):
+            self.info["primary"] = self.info["wrote"] = True
+        if self.info.get("primary"):
+            return self.router.primary
+
+        replica = self.info.get("replica")
+        if replica is None:
+            replica = self.info["replica"] = self._pick_replica()
+        return replica
+
+    def _pick_replica(self):
+        if is_recent_writer(self.client()):
+            self.info["primary"] = True
+            return self.router.primary
+
+        for replica in self.router.candidates():
+            try:
+                # Check the connection out now (pre-ping included), so a dead replica fails over
+                # here instead of failing the query
+                self.connection(bind_arguments={"bind": replica})
+                return replica
+            except DBAPIError as e:
+                self.rollback()
+                self.router.mark_down(replica, e)
+        return self.router.primary
+
+    def client(self):
+        request = self.info.get("request")
+        return request_client(request) if request is not None else self.info.get("client")
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _remember_writer(db: Session):
+    if db.info.pop("wrote", False):
+        client = db.client()
+        if client is not None:
+            mark_recent_write(client)
+
+
+# Make a session read from the primary, for reads that must not be stale (e.g. before deciding on a write)
+def use_primary(db: Session):
+    db.info["primary"] = True
+
+
+class SyncRoutingSession(RoutingSession):
+    router = ReplicaRouter(engine, replica_engines)
+
+
+session = sessionmaker(
+    bind=engine, class_=SyncRoutingSession if replica_engines else Session, autoflush=False, autocommit=False
+)
+
+
+# Same database as DATABASE_URL but with the async driver, e.g. postgresql:// -> postgresql+asyncpg://
+def to_async_url(url: str):
+    url = make_url(url)
+    if url.get_backend_name() == "postgresql":
+        query = dict(url.query)
+        # asyncpg calls it "ssl", Neon style URLs use libpq's "sslmode"
+        if "sslmode" in query:
+            query["ssl"] = query.pop("sslmode")
+        return url.set(drivername="postgresql+asyncpg", query=query)
+    if url.get_backend_name() == "sqlite":
+        return url.set(drivername="sqlite+aiosqlite")
+    return url
+
+
+async_engine = create_async_engine(to_async_url(DATABASE_URL), **_engine_options(DATABASE_URL, is_async=True)) if DB_ASYNC else None
+async_replica_engines = [
+    create_async_engine(to_async_url(url), **_engine_options(url, is_async=True)) for url in DATABASE_REPLICA_URLS
+] if DB_ASYNC else []
+
+
+# AsyncSession runs a sync Session underneath, it routes with the sync cores of the async engines
+class AsyncRoutingSession(RoutingSession):
+    router = ReplicaRouter(
+        async_engine.sync_engine if async_engine is not None else None,
+        [replica.sync_engine for replica in async_replica_engines],
+    )
+
+
+async_session = async_sessionmaker(
+    bind=async_engine, sync_session_class=AsyncRoutingSession if async_replica_engines else Session, autoflush=False
+) if DB_ASYNC else None
+
+
+# create_all() only creates missing tables, indexes added later to an existing table have to be created separately
+# create_all() doesn't change existing tables either: add columns that were added to a model later.
+# Such columns must be nullable or have a server_default, so the existing rows get a value.
+def create_missing_columns(engine):
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                definition = f"{column.name} {column.type.compile(engine.dialect)}"
+                if column.server_default is not None:
+                    definition += f" DEFAULT {column.server_default.arg}"
+                if not column.nullable:
+                    definition += " NOT NULL"
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {definition}"))
+
+
+# SQLite hands the id of the newest deleted row to the next insert unless the table was created with AUTOINCREMENT.
+# Tables that ask for it (sqlite_autoincrement=True) but were created without it are rebuilt once: new table,
+# copy the rows with their ids, swap. Runs before create_missing_indexes, which recreates the indexes;
+# triggers on the old table go with it and are recreated by their own init steps.
+def enable_sqlite_autoincrement(engine):
+    if engine.dialect.name != "sqlite":
+        return
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not table.dialect_options["sqlite"]["autoincrement"]:
+                continue
+            sql = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                               {"name": table.name}).scalar()
+            if sql is None or "AUTOINCREMENT" in sql.upper():
+                continue
+
+            rebuilt = table.to_metadata(MetaData(), name=f"{table.name}_rebuild")
+            columns = ", ".join(column.name for column in table.columns)
+            conn.execute(CreateTable(rebuilt))
+            conn.execute(text(f"INSERT INTO {rebuilt.name} ({columns}) SELECT {columns} FROM {table.name}"))
+            conn.execute(text(f"DROP TABLE {table.name}"))
+            conn.execute(text(f"ALTER TABLE {rebuilt.name} RENAME TO {table.name}"))
+            logger.info(f"Rebuilt table {table.name} with AUTOINCREMENT")
+
+
+# IF NOT EXISTS instead of checkfirst: reflection can't see expression indexes, and it is one round trip less per index.
+def create_missing_indexes(engine):
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                conn.execute(CreateIndex(index, if_not_exists=True))
+
+
+# Current state of the connection pool(s) for health checks and metrics
+def get_pool_status():
+    pools = {"sync": engine.pool}
+    if async_engine is not None:
+        pools["async"] = async_engine.sync_engine.pool
+    for index, replica in enumerate(replica_engines):
+        pools[f"replica_{index}"] = replica.pool
+    for index, replica in enumerate(async_replica_engines):
+        pools[f"async_replica_{index}"] = replica.sync_engine.pool
+
+    status = {}
+    for name, pool in pools.items():
+        if not isinstance(pool, QueuePool):
+            status[name] = {"type": type(pool).__name__}
+            continue
+
+        checked_out = pool.checkedout()
+        # Every QueuePool here is built by _engine_options, so its overflow limit is the configured one
+        capacity = pool.size() + max(DB_MAX_OVERFLOW, 0)
+        status[name] = {
+            "type": type(pool).__name__,
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": checked_out,
+            "overflow": max(pool.overflow(), 0),
+            "max_overflow": DB_MAX_OVERFLOW,
+            "saturation": round(checked_out / capacity, 3) if capacity > 0 else 0.0,
+        }
+
+    with pool_stats.lock:
+        status["checkout_wait"] = {
+            "checkouts": pool_stats.checkouts,
+            "timeouts": pool_stats.timeouts,
+            "wait_seconds_total": round(pool_stats.wait_seconds_total, 6),
+            "wait_seconds_max": round(pool_stats.wait_seconds_max, 6),
+        }
+    return status
+
+
+# Dependency to get the database session. The request tells a routing session which client it serves.
+def get_db(request: Request):
+    db = session(info={"request": request})
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+# Async version of get_db, used when DB_ASYNC=true
+async def get_async_db(request: Request):
+    async with async_session(info={"request": request}) as db:
+        yield db
+
+
+# The dependency routes use, picked once from the config
+get_session = get_async_db if DB_ASYNC else get_db
+
+
+# Run sync ORM code (a function taking a Session as first argument) without blocking the event loop.
+# AsyncSession runs it on its async connection (no thread needed), a normal Session runs it in the threadpool.
+async def run_db(db: AnySession, func, *args):
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(func, *args)
+    return await run_in_threadpool(func, db, *args)
+
+
+# INSERT construct with ON CONFLICT support for the current database. Both dialects have it,
+# they just live in different modules.
+def upsert_insert(db: Session):
+    if db.get_bind().dialect.name == "postgresql":
+        return postgresql.insert
+    return sqlite.insert
@@ -0,0 +1,191 @@
+import os
+from datetime import datetime, timezone
+
+from dotenv import load_dotenv
+from sqlalchemy import case, func, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+import backend.models as models
+from backend.product_query import PRODUCT_COLUMNS
+
+load_dotenv()
+
+LOW_STOCK_THRESHOLD = int(os.getenv("LOW_STOCK_THRESHOLD", "10"))  # default ?threshold= of /products/stats and /low-stock
+# Rows the catalog totals are spread over. Each product write locks one of them, more shards = more writers
+# at the same time, at the cost of summing that many rows per /products/stats.
+SUMMARY_SHARDS = max(1, int(os.getenv("SUMMARY_SHARDS", "16")))
+
+STOCK_VALUE = models.Product.price * models.Product.quantity  # same expression as ix_product_stock_value
+
+
+# ---------------- SUMMARY MAINTENANCE ----------------
+
+# Triggers add every product insert/update/delete to the summary shard of that product, in the same transaction
+# as the write. That covers every route (single writes, stock adjustments, bulk upserts) and lets those routes
+# write a product with a single UPDATE ... RETURNING, without reading the old price/quantity first.
+# Relative updates (x = x + delta), so concurrent writers can't overwrite each other's changes.
+# The shard count is part of the trigger code, so the triggers are recreated on every start.
+def ensure_summary_triggers(engine: Engine):
+    with engine.begin() as conn:
+        if engine.dialect.name == "postgresql":
+            conn.execute(text(_POSTGRES_FUNCTION))
+            conn.execute(text("DROP TRIGGER IF EXISTS product_summary ON product"))
+            conn.execute(text(
+                "CREATE TRIGGER product_summary AFTER INSERT OR DELETE OR UPDATE OF price, quantity ON product "
+                "FOR EACH ROW EXECUTE FUNCTION product_summary_change()"
+            ))
+        elif engine.dialect.name == "sqlite":
+            for name in ("product_summary_insert", "product_summary_delete", "product_summary_update"):
+                conn.execute(text(f"DROP TRIGGER IF EXISTS {name}"))
+            for statement in _SQLITE_TRIGGERS:
+                conn.execute(text(statement))
+
+
+def _sqlite_change(sign: str, row: str):
+    return (
+        f"product_count = product_count {sign} 1, "
+        f"total_quantity = total_quantity {sign} {row}.quantity, "
+        f"total_value = total_value {sign} {row}.price * {row}.quantity, "
+        f"out_of_stock_count = out_of_stock_count {sign} ({row}.quantity = 0)"
+    )
+
+
+_SUMMARY_TIMESTAMP = "updated_at = strftime('%Y-%m-%d %H:%M:%f', 'now')"
+
+_SQLITE_TRIGGERS = [
+    "CREATE TRIGGER product_summary_insert AFTER INSERT ON product BEGIN "
+    f"UPDATE inventory_summary SET {_sqlite_change('+', 'new')}, {_SUMMARY_TIMESTAMP} "
+    f"WHERE id = new.id % {SUMMARY_SHARDS}; END",
+
+    "CREATE TRIGGER product_summary_delete AFTER DELETE ON product BEGIN "
+    f"UPDATE inventory_summary SET {_sqlite_change('-', 'old')}, {_SUMMARY_TIMESTAMP} "
+    f"WHERE id = old.id % {SUMMARY_SHARDS}; END",
+
+    # Old row out, new row in. product_count cancels out, SQLite evaluates all SET expressions on the old summary row.
+    "CREATE TRIGGER product_summary_update AFTER UPDATE OF price, quantity ON product BEGIN "
+    "UPDATE inventory_summary SET "
+    "total_quantity = total_quantity - old.quantity + new.quantity, "
+    "total_value = total_value - old.price * old.quantity + new.price * new.quantity, "
+    "out_of_stock_count = out_of_stock_count - (old.quantity = 0) + (new.quantity = 0), "
+    f"{_SUMMARY_TIMESTAMP} WHERE id = new.id % {SUMMARY_SHARDS}; END",
+]
+
+_POSTGRES_FUNCTION = f"""
+CREATE OR REPLACE FUNCTION product_summary_change() RETURNS trigger AS $$
+DECLARE
+    d_count integer := 0;
+    d_quantity bigint := 0;
+    d_value double precision := 0;
+    d_out integer := 0;
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        d_count := d_count - 1;
+        d_quantity := d_quantity - OLD.quantity;
+        d_value := d_value - OLD.price * OLD.quantity;
+        d_out := d_out - (OLD.quantity = 0)::integer;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'INSERT') THEN
+        d_count := d_count + 1;
+        d_quantity := d_quantity + NEW.quantity;
+        d_value := d_value + NEW.price * NEW.quantity;
+        d_out := d_out + (NEW.quantity = 0)::integer;
+    END IF;
+
+    UPDATE inventory_summary SET
+        product_count = product_count + d_count,
+        total_quantity = total_quantity + d_quantity,
+        total_value = total_value + d_value,
+        out_of_stock_count = out_of_stock_count + d_out,
+        updated_at = now()
+    WHERE id = (CASE WHEN TG_OP = 'DELETE' THEN OLD.id ELSE NEW.id END) % {SUMMARY_SHARDS};
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+
+# Catalog totals straight from the product table (one full scan)
+def _product_totals():
+    return (
+        func.count(models.Product.id).label("product_count"),
+        func.coalesce(func.sum(models.Product.quantity), 0).label("total_quantity"),
+        func.coalesce(func.sum(STOCK_VALUE), 0.0).label("total_value"),
+        func.count(case((models.Product.quantity == 0, 1))).label("out_of_stock_count"),
+    )
+
+
+# Recompute the summary shards from the product table (one full scan). Runs in init_schema, which also clears
+# any float rounding drift in total_value, covers rows written while the triggers didn't exist yet and
+# reshards after SUMMARY_SHARDS changed. Never called from a request: it writes and takes the shard locks.
+def refresh_summary(db: Session):
+    shard = models.Product.id % SUMMARY_SHARDS
+    totals = {row.shard: row for row in db.query(shard.label("shard"), *_product_totals()).group_by(shard)}
+
+    now = datetime.now(timezone.utc)
+    for shard_id in range(SUMMARY_SHARDS):
+        row = totals.get(shard_id)
+        db.merge(models.InventorySummary(
+            id=shard_id,
+            product_count=row.product_count if row else 0,
+            total_quantity=row.total_quantity if row else 0,
+            total_value=row.total_value if row else 0.0,
+            out_of_stock_count=row.out_of_stock_count if row else 0,
+            updated_at=now,
+        ))
+    # Shards left over from a larger SUMMARY_SHARDS
+    db.query(models.InventorySummary).filter(models.InventorySummary.id >= SUMMARY_SHARDS).delete()
+    db.commit()
+
+
+def _read_summary(db: Session):
+    return db.query(
+        func.count(models.InventorySummary.id).label("shards"),
+        func.coalesce(func.sum(models.InventorySummary.product_count), 0).label("product_count"),
+        func.coalesce(func.sum(models.InventorySummary.total_quantity), 0).label("total_quantity"),
+        func.coalesce(func.sum(models.InventorySummary.total_value), 0.0).label("total_value"),
+        func.coalesce(func.sum(models.InventorySummary.out_of_stock_count), 0).label("out_of_stock_count"),
+        func.max(models.InventorySummary.updated_at).label("updated_at"),
+    ).one()
+
+
+# ---------------- READS ----------------
+
+# Read only. The shards are summed whatever their number: triggers and rows are created together by init_schema,
+# so they match even if this worker has another SUMMARY_SHARDS. Without any summary row (the schema is managed
+# elsewhere and init_schema never ran) the totals are aggregated from the product table instead.
+def get_inventory_stats(db: Session, threshold: int, top: int):
+    summary = _read_summary(db)
+    updated_at = summary.updated_at
+    if summary.shards == 0:
+        summary = db.query(*_product_totals()).one()
+        updated_at = datetime.now(timezone.utc)
+
+    # Both use an index: a range count on ix_product_quantity_id and an ordered scan of ix_product_stock_value
+    low_stock_count = db.query(func.count(models.Product.id)).filter(models.Product.quantity <= threshold).scalar()
+    top_rows = db.query(*PRODUCT_COLUMNS, STOCK_VALUE.label("stock_value")) \
+        .order_by(STOCK_VALUE.desc()).limit(top).all() if top else []
+
+    return {
+        "product_count": summary.product_count,
+        "total_quantity": summary.total_quantity,
+        "total_value": round(summary.total_value, 2),
+        "out_of_stock_count": summary.out_of_stock_count,
+        "low_stock_threshold": threshold,
+        "low_stock_count": low_stock_count,
+        "top_by_value": [row._asdict() for row in top_rows],
+        "updated_at": updated_at.isoformat(),
+    }
+
+
+# Products with quantity <= threshold, emptiest first
+def get_low_stock(db: Session, threshold: int, page: int, limit: int):
+    rows = (
+        db.query(*PRODUCT_COLUMNS)
+        .filter(models.Product.quantity <= threshold)
+        .order_by(models.Product.quantity, models.Product.id)
+        .offset((page - 1) * limit)
+        .limit(limit)
+        .all()
+    )
+    return [row._asdict() for row in rows]
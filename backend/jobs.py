@@ -0,0 +1,173 @@
+import os
+import queue
+import threading
+import time
+
+from dotenv import load_dotenv
+
+from backend.logging_config import logger
+from backend.metrics import job_lag, job_queue_depth, jobs_processed
+
+load_dotenv()
+
+# Jobs that may wait. When the queue is full new jobs are dropped (see register_job for what is done about it),
+# never run in the caller: that could be the event loop.
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "10000"))
+JOB_BATCH_SIZE = int(os.getenv("JOB_BATCH_SIZE", "100"))  # queued jobs of one kind handled in one call
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+JOB_RETRY_DELAY_SECONDS = float(os.getenv("JOB_RETRY_DELAY_SECONDS", "0.5"))  # doubled after every failed attempt
+
+
+class Job:
+    __slots__ = ("kind", "payload", "enqueued_at", "attempts")
+
+    def __init__(self, kind: str, payload):
+        self.kind = kind
+        self.payload = payload
+        self.enqueued_at = time.monotonic()
+        self.attempts = 0
+
+
+# kind -> handler(payloads: list). A handler gets every queued job of its kind at once, so it can batch
+# them (one pipeline, one executemany) or coalesce them (ten "catalog changed" jobs -> one cache warm up).
+_handlers = {}
+# kind -> on_dropped(). Called once in the worker thread when it has caught up, for all jobs of that kind
+# dropped meanwhile, e.g. tell clients to reload instead of sending the lost events. Without one, dropped
+# jobs are only counted.
+_drop_handlers = {}
+
+
+def register_job(kind: str, handler, on_dropped=None):
+    _handlers[kind] = handler
+    if on_dropped is not None:
+        _drop_handlers[kind] = on_dropped
+
+
+# Post-commit side effects run here, after the response is on its way, so write latency only covers the
+# DB transaction. One worker thread, so jobs of one kind run in the order they were enqueued.
+class JobWorker:
+    def __init__(self, max_size: int):
+        self.queue = queue.Queue(maxsize=max_size)
+        self.thread = None
+        self.lock = threading.Lock()
+        self.dropped = set()  # kinds with jobs dropped since the worker last caught up
+
+    def enqueue(self, kind: str, payload=None):
+        self.start()
+        job = Job(kind, payload)
+        try:
+            self.queue.put_nowait(job)
+        except queue.Full:
+            self._drop(job)
+        job_queue_depth.set(value=self.queue.qsize())
+
+    def _drop(self, job: Job):
+        jobs_processed.inc(job.kind, "dropped")
+        with self.lock:
+            if not self.dropped:
+                logger.warning(f"Background job queue is full, dropping jobs (first: {job.kind})")
+            self.dropped.add(job.kind)
+
+    def start(self):
+        if self.thread is not None and self.thread.is_alive():
+            return
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._work, name="jobs", daemon=True)
+                self.thread.start()
+
+    # Let queued jobs finish (up to timeout seconds) and stop the thread
+    def stop(self, timeout: float = 5):
+        if self.thread is None or not self.thread.is_alive():
+            return
+        self.queue.put(None)
+        self.thread.join(timeout)
+        self.thread = None
+
+    def _work(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+
+            # Take whatever else is already waiting and handle it grouped by kind
+            batch = {job.kind: [job]}
+            stop = False
+            while sum(len(jobs) for jobs in batch.values()) < JOB_BATCH_SIZE:
+                try:
+                    job = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if job is None:
+                    stop = True
+                    break
+                batch.setdefault(job.kind, []).append(job)
+            job_queue_depth.set(value=self.queue.qsize())
+
+            now = time.monotonic()
+            for kind, jobs in batch.items():
+                for job in jobs:
+                    job_lag.observe(kind, value=now - job.enqueued_at)
+                self._run(kind, jobs)
+
+            if self.queue.empty():
+                self._run_drop_handlers()
+            if stop:
+                return
+
+    def _run_drop_handlers(self):
+        with self.lock:
+            kinds, self.dropped = self.dropped, set()
+        for kind in kinds:
+            on_dropped = _drop_handlers.get(kind)
+            if on_dropped is None:
+                continue
+            try:
+                on_dropped()
+            except Exception as e:
+                logger.error(f"Handling dropped background jobs {kind} failed: {e}")
+
+    def _run(self, kind: str, jobs: list[Job]):
+        handler = _handlers.get(kind)
+        if handler is None:
+            logger.error(f"No handler for background job {kind}, {len(jobs)} dropped")
+            jobs_processed.inc(kind, "failed", amount=len(jobs))
+            return
+
+        try:
+            handler([job.payload for job in jobs])
+            jobs_processed.inc(kind, "ok", amount=len(jobs))
+        except Exception as e:
+            self._retry(kind, jobs, e)
+
+    def _retry(self, kind: str, jobs: list[Job], error: Exception):
+        attempts = max(job.attempts for job in jobs) + 1
+        if attempts >= JOB_MAX_ATTEMPTS:
+            logger.error(f"Background job {kind} failed {attempts} times, {len(jobs)} dropped: {error}")
+            jobs_processed.inc(kind, "failed", amount=len(jobs))
+            return
+
+        delay = JOB_RETRY_DELAY_SECONDS * 2 ** (attempts - 1)
+        logger.warning(f"Background job {kind} failed, retrying in {delay:.1f}s: {error}")
+        jobs_processed.inc(kind, "retried", amount=len(jobs))
+        for job in jobs:
+            job.attempts = attempts
+
+        # Timer instead of sleeping here, so other kinds keep running meanwhile
+        timer = threading.Timer(delay, self._requeue, args=(jobs,))
+        timer.daemon = True
+        timer.start()
+
+    def _requeue(self, jobs: list[Job]):
+        for job in jobs:
+            try:
+                self.queue.put_nowait(job)
+            except queue.Full:
+                self._drop(job)
+
+
+job_worker = JobWorker(JOB_QUEUE_SIZE)
+
+
+def enqueue_job(kind: str, payload=None):
+    job_worker.enqueue(kind, payload)
@@ -0,0 +1,32 @@
+from functools import lru_cache
+from typing import Any
+
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+
+try:
+    import orjson  # optional (pip install orjson), several times faster than the stdlib json module
+except ImportError:
+    orjson = None
+
+
+# Building a TypeAdapter compiles a validator/serializer, so build one per type and keep it
+@lru_cache(maxsize=None)
+def get_adapter(type_):
+    return TypeAdapter(type_)
+
+
+# Serialize plain data (dicts, lists, str, int, float, None, datetime) to JSON bytes.
+# Without orjson, pydantic-core's serializer (also native code) is used instead of json.dumps.
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return get_adapter(Any).dump_json(content)
+
+
+# Default response class of the app. Routes that build their rows straight from a column-projected
+# query return this directly, which skips FastAPI's per-item response_model validation and
+# jsonable_encoder pass: the rows come from our own DB columns, so their types are already right.
+class ORJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,107 @@
+import os
+import time
+from contextlib import asynccontextmanager
+
+from dotenv import load_dotenv
+from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import text
+
+from backend.auth_config import start_hash_executor, start_token_revocations, stop_hash_executor, stop_token_revocations
+from backend.database import (
+    DB_POOL_SIZE, Base, async_engine, create_missing_columns, create_missing_indexes, enable_sqlite_autoincrement, engine, session,
+)
+from backend.inventory_stats import ensure_summary_triggers, refresh_summary
+from backend.jobs import job_worker
+from backend.logging_config import logger, start_log_listener, stop_log_listener
+from backend.routes.products import warm_product_cache
+from backend.search_index import detect_search_backend, ensure_search_index
+
+load_dotenv()
+
+# Create tables/indexes when a worker starts. The launcher (python -m backend.server) does this once
+# in the parent process and sets it to false for the workers, so they don't all run the same DDL.
+DB_INIT_ON_STARTUP = os.getenv("DB_INIT_ON_STARTUP", "true").lower() == "true"
+# Connections opened at startup so the first requests don't pay for connecting (capped at DB_POOL_SIZE)
+DB_WARM_CONNECTIONS = min(int(os.getenv("DB_WARM_CONNECTIONS", "2")), DB_POOL_SIZE)
+
+
+# Create every table and index the app needs and rebuild derived data. Idempotent, safe to run on every start.
+def init_schema():
+    Base.metadata.create_all(engine) # Takes metadata from Base and create all tables.
+    create_missing_columns(engine) # New columns on tables that already existed
+    enable_sqlite_autoincrement(engine) # SQLite tables from before they asked for AUTOINCREMENT
+    create_missing_indexes(engine) # New indexes on tables that already existed
+    ensure_search_index(engine) # Full-text index for /products/search (tsvector/pg_trgm on Postgres, FTS5 on SQLite)
+
+    # Catalog totals behind /products/stats: triggers keep them current, the recount creates the row
+    # on a new database and corrects anything written before the triggers existed
+    ensure_summary_triggers(engine)
+    db = session(info={"primary": True})
+    try:
+        refresh_summary(db)
+    finally:
+        db.close()
+
+
+def _warm_sync():
+    # Check out several connections at once so the pool really opens that many
+    connections = [engine.connect() for _ in range(DB_WARM_CONNECTIONS)]
+    try:
+        for conn in connections:
+            conn.execute(text("SELECT 1"))
+    finally:
+        for conn in connections:
+            conn.close()
+
+    db = session()
+    try:
+        warm_product_cache(db)
+    finally:
+        db.close()
+
+
+async def _warm_async():
+    connections = [await async_engine.connect() for _ in range(DB_WARM_CONNECTIONS)]
+    try:
+        for conn in connections:
+            await conn.execute(text("SELECT 1"))
+    finally:
+        for conn in connections:
+            await conn.close()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    started = time.perf_counter()
+    start_log_listener()
+    start_hash_executor()
+    start_token_revocations()
+    job_worker.start()
+
+    if DB_INIT_ON_STARTUP:
+        await run_in_threadpool(init_schema)
+    else:
+        await run_in_threadpool(detect_search_backend, engine)
+
+    # A cold pool or cache only makes the first requests slower, it is not a reason to fail startup
+    try:
+        await run_in_threadpool(_warm_sync)
+        if async_engine is not None:
+            await _warm_async()
+    except Exception as e:
+        logger.warning(f"Warm up failed: {e}")
+
+    logger.info(f"Worker {os.getpid()} ready in {(time.perf_counter() - started) * 1000:.0f} ms")
+    yield
+
+    # Shutdown: finish queued background jobs, return DB connections and let the log queue drain
+    # before the process exits
+    await run_in_threadpool(job_worker.stop)
+    stop_hash_executor()
+    stop_token_revocations()
+    if async_engine is not None:
+        await async_engine.dispose()
+    engine.dispose()
+    logger.info(f"Worker {os.getpid()} stopped")
+    stop_log_listener()
@@ -1,27 +1,172 @@
+import atexit
+import contextvars
+import json
 import logging
 import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
+
+from dotenv import load_dotenv
+
+load_dotenv()
 
 LOG_DIR = "logs"
 LOG_FILE = "logs/app.log"
 
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # "json" or "text"
+LOG_ROTATION = os.getenv("LOG_ROTATION", "size")  # "size" or "time"
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))  # size rotation: 10 MB per file
+LOG_ROTATE_WHEN = os.getenv("LOG_ROTATE_WHEN", "midnight")  # time rotation: see TimedRotatingFileHandler "when"
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))  # records waiting to be written, newer ones are dropped when full
+# Repeated warnings/errors from the same line: first LOG_RATE_LIMIT_BURST per window are kept, then 1 in LOG_SAMPLE_RATE
+LOG_RATE_LIMIT_BURST = int(os.getenv("LOG_RATE_LIMIT_BURST", "20"))
+LOG_RATE_LIMIT_WINDOW = float(os.getenv("LOG_RATE_LIMIT_WINDOW", "60"))
+LOG_SAMPLE_RATE = int(os.getenv("LOG_SAMPLE_RATE", "100"))
+# logs/app.log has one writer: with several workers each would rotate it on its own and lines would be lost
+# or overwritten, so then they log to the console only and the process manager collects it
+LOG_TO_FILE = int(os.getenv("WEB_CONCURRENCY", "1")) <= 1
+
 os.makedirs(LOG_DIR, exist_ok=True)
 
+# Info about the current request (request_id, method, route, user_id), set by the middleware in main.py.
+# It holds a dict so values added later (like user_id from the auth dependency, which may run in another
+# thread) are seen by every log call of the same request.
+request_context = contextvars.ContextVar("request_context", default=None)
+
+
+# Copies the request context onto each record. Runs in the thread that logs, before the record is queued.
+class RequestContextFilter(logging.Filter):
+    def filter(self, record):
+        context = request_context.get() or {}
+        for key in ("request_id", "user_id", "method", "route"):
+            if not hasattr(record, key):
+                setattr(record, key, context.get(key))
+        return True
+
+
+# Stops a warning/error that fires on every request from flooding the log.
+# Records are grouped by the line of code that logged them.
+class RateLimitFilter(logging.Filter):
+    def __init__(self, burst: int, window_seconds: float, sample_rate: int):
+        super().__init__()
+        self.burst = burst
+        self.window_seconds = window_seconds
+        self.sample_rate = max(sample_rate, 1)
+        self.lock = threading.Lock()
+        self.windows = {}  # (pathname, lineno) -> [window_start, count, suppressed]
+
+    def filter(self, record):
+        if record.levelno < logging.WARNING:
+            return True
+
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self.lock:
+            window = self.windows.get(key)
+            if window is None or now - window[0] >= self.window_seconds:
+                window = self.windows[key] = [now, 0, 0]
+                if len(self.windows) > 10000:  # don't grow forever
+                    self.windows = {key: window}
+
+            window[1] += 1
+            if window[1] <= self.burst or window[1] % self.sample_rate == 0:
+                if window[2]:
+                    record.suppressed = window[2]  # how many similar lines were skipped since the last one
+                    window[2] = 0
+                return True
+
+            window[2] += 1
+            return False
+
+
+# QueueHandler with a bounded queue: if the writer thread can't keep up we drop the record
+# (and count it) instead of blocking the request.
+class DroppingQueueHandler(QueueHandler):
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    FIELDS = ("request_id", "user_id", "method", "route", "status_code", "latency_ms", "suppressed")
+
+    def format(self, record):
+        data = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field in self.FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                data[field] = value
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str)
+
+
 logger = logging.getLogger("app")
 logger.setLevel(logging.INFO)
 
-formatter = logging.Formatter(
-    "[%(levelname)s]   %(asctime)s - %(message)s"
-)
+if LOG_FORMAT == "json":
+    formatter = JsonFormatter()
+else:
+    formatter = logging.Formatter(
+        "[%(levelname)s]   %(asctime)s - %(message)s"
+    )
 
 # Console handler
 console_handler = logging.StreamHandler()
 console_handler.setFormatter(formatter)
 
-# File handler
-file_handler = logging.FileHandler(LOG_FILE)
-file_handler.setFormatter(formatter)
+handlers = [console_handler]
+
+# File handler, rotated so the log can't grow without limit
+if LOG_TO_FILE:
+    if LOG_ROTATION == "time":
+        file_handler = TimedRotatingFileHandler(LOG_FILE, when=LOG_ROTATE_WHEN, backupCount=LOG_BACKUP_COUNT)
+    else:
+        file_handler = RotatingFileHandler(LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT)
+    file_handler.setFormatter(formatter)
+    handlers.append(file_handler)
+
+# Request threads only put records on the queue, a background thread does the actual (blocking) writing
+log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+queue_handler = DroppingQueueHandler(log_queue)
+queue_handler.addFilter(RequestContextFilter())
+queue_handler.addFilter(RateLimitFilter(LOG_RATE_LIMIT_BURST, LOG_RATE_LIMIT_WINDOW, LOG_SAMPLE_RATE))
+queue_listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+
+
+# Start the writer thread if it isn't running in this process. Threads don't survive fork(),
+# so a worker forked from a preloaded parent (gunicorn --preload) has to start its own.
+def start_log_listener():
+    thread = queue_listener._thread
+    if thread is None or not thread.is_alive():
+        queue_listener._thread = None
+        queue_listener.start()
+
+
+# Flush what is left in the queue and stop the writer thread. Safe to call more than once.
+def stop_log_listener():
+    thread = queue_listener._thread
+    if thread is not None and thread.is_alive():
+        queue_listener.stop()
+
 
 # Avoid duplicate logs
 if not logger.hasHandlers():
-    logger.addHandler(console_handler)
-    logger.addHandler(file_handler)
\ No newline at end of file
+    logger.addHandler(queue_handler)
+    start_log_listener()
+    atexit.register(stop_log_listener)  # flush what is left in the queue on shutdown
@@ -1,21 +1,46 @@
-from fastapi import FastAPI, Depends
+import os
+import time
+import uuid
+
+from fastapi import FastAPI, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
+from sqlalchemy import text
 
-from backend.auth_config import get_current_user
+from backend.auth_config import require_login
 from backend.routes.products import router as product_router
 from backend.routes.users import router as user_router
 from backend.routes.auth import router as auth_router
-from backend.database import Base, engine
+from backend.database import engine, get_pool_status
 from backend.exceptions import AppException, app_exception_handler, generic_exception_handler
-from backend.logging_config import logger
+from backend.logging_config import logger, request_context
+from backend.metrics import metrics_middleware, render_metrics
+from backend.rate_limit import rate_limit_middleware
+from backend.compression import BROTLI_QUALITY, COMPRESSION_ENABLED, COMPRESSION_MIN_SIZE, GZIP_LEVEL, CompressionMiddleware
+from backend.lifecycle import lifespan
+from backend.json_response import ORJSONResponse
 from fastapi.openapi.utils import get_openapi
 
 
-app = FastAPI()
+# Schema setup, pool/cache warm up and clean shutdown happen in lifespan (backend/lifecycle.py).
+# In production start the app with the launcher: python -m backend.server --workers 4
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+
+HEALTH_SATURATION_WARNING = 0.9 # /health reports "degraded" when this share of pooled connections is in use
+LOG_ACCESS = os.getenv("LOG_ACCESS", "true").lower() == "true" # one log line per request with status and latency
 
 app.openapi_schema = None
 
-Base.metadata.create_all(engine) # Takes metadata from Base and create all tables.
+# Brotli/gzip for bodies over COMPRESSION_MIN_SIZE (big pages, batches, exports). It has to sit inside the
+# @app.middleware("http") ones: those re-stream every body in chunks, so it could no longer tell a small body from a stream.
+if COMPRESSION_ENABLED:
+    app.add_middleware(
+        CompressionMiddleware, minimum_size=COMPRESSION_MIN_SIZE, gzip_level=GZIP_LEVEL, brotli_quality=BROTLI_QUALITY
+    )
+
+# Per-client token buckets and a concurrency cap (429/503 with Retry-After). Added before CORS so it runs
+# inside it: CORS headers still get added to rejections and they show up in the metrics and access log.
+app.middleware("http")(rate_limit_middleware)
 
 app.add_middleware(
     CORSMiddleware,
@@ -25,6 +50,37 @@ app.add_middleware(
     allow_credentials=True,
 )
 
+# Latency / status / DB time metrics for every request, exported at /metrics
+app.middleware("http")(metrics_middleware)
+
+
+# Gives every request an id (or reuses X-Request-ID from a proxy) that is added to all its log lines,
+# and writes one structured access log line with status and latency at the end.
+@app.middleware("http")
+async def request_context_middleware(request: Request, call_next):
+    request_id = request.headers.get("x-request-id") or uuid.uuid4().hex
+    context = {"request_id": request_id, "method": request.method, "route": request.url.path}
+    token = request_context.set(context)
+    started = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        response.headers["X-Request-ID"] = request_id
+        return response
+    finally:
+        # Route template (/products/{product_id}) groups better than the raw path
+        route = request.scope.get("route")
+        if route is not None:
+            context["route"] = route.path
+        if LOG_ACCESS:
+            logger.info(
+                f"{request.method} {context['route']} {status_code}",
+                extra={"status_code": status_code, "latency_ms": round((time.perf_counter() - started) * 1000, 2)}
+            )
+        request_context.reset(token)
+
+
 # Registering custom and generic exception handlers
 app.add_exception_handler(AppException, app_exception_handler)
 app.add_exception_handler(Exception, generic_exception_handler)
@@ -36,7 +92,44 @@ def greet():
     return "Welcome to Inventory Management System"
 
 
+# Health check for load balancers / monitoring: DB reachability and connection pool saturation
+@app.get("/health", tags=["Root"])
+def health():
+    pool = get_pool_status()
+    saturation = max((p["saturation"] for p in pool.values() if "saturation" in p), default=0.0)
+
+    if saturation >= 1:
+        # Every connection is busy, don't queue behind them just to run SELECT 1
+        database = "saturated"
+    else:
+        try:
+            with engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+            database = "ok"
+        except Exception as e:
+            logger.error(f"Health check failed: {e}")
+            database = "unreachable"
+
+    if database == "unreachable":
+        status_text = "down"
+    elif saturation >= HEALTH_SATURATION_WARNING:
+        status_text = "degraded"
+    else:
+        status_text = "ok"
+
+    return JSONResponse(
+        status_code=503 if status_text == "down" else 200,
+        content={"status": status_text, "database": database, "pool": pool}
+    )
+
+
+# Prometheus metrics (request latency, status counts, DB queries/time per request, hashing time, pool usage)
+@app.get("/metrics", tags=["Root"], response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
 # IMPORTANT: includes api endpoints from routes
 app.include_router(auth_router)
-app.include_router(product_router, dependencies=[Depends(get_current_user)])
-app.include_router(user_router, dependencies=[Depends(get_current_user)])
+app.include_router(product_router, dependencies=[Depends(require_login)])
+app.include_router(user_router, dependencies=[Depends(require_login)])
@@ -0,0 +1,252 @@
+import contextvars
+import cProfile
+import os
+import threading
+import time
+from datetime import datetime
+
+from dotenv import load_dotenv
+from fastapi import Request
+from sqlalchemy import event
+
+from backend.database import async_engine, async_replica_engines, engine, get_pool_status, replica_engines
+from backend.logging_config import LOG_DIR, logger, queue_handler
+
+load_dotenv()
+
+# Opt-in profiler: dump a profile of every request slower than the threshold into logs/profiles/
+SLOW_REQUEST_PROFILE = os.getenv("SLOW_REQUEST_PROFILE", "false").lower() == "true"
+SLOW_REQUEST_THRESHOLD_MS = float(os.getenv("SLOW_REQUEST_THRESHOLD_MS", "1000"))
+PROFILE_DIR = os.path.join(LOG_DIR, "profiles")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    escaped = [str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in values]
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, escaped)) + "}"
+
+
+# ---------------- METRIC TYPES (Prometheus text format) ----------------
+
+class Counter:
+    type_name = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self.values = {}
+        self.lock = threading.Lock()
+        registry.append(self)
+
+    def inc(self, *labels, amount: float = 1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    # For totals that are counted elsewhere (pool stats, log queue) and copied in at export time
+    def set_total(self, *labels, value: float):
+        with self.lock:
+            self.values[labels] = value
+
+    def samples(self):
+        with self.lock:
+            return [(self.name, _format_labels(self.labelnames, labels), value) for labels, value in self.values.items()]
+
+
+class Gauge(Counter):
+    type_name = "gauge"
+
+    def set(self, *labels, value: float):
+        with self.lock:
+            self.values[labels] = value
+
+
+class Histogram:
+    type_name = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self.values = {}  # labels -> [bucket counts..., sum, count]
+        self.lock = threading.Lock()
+        registry.append(self)
+
+    def observe(self, *labels, value: float):
+        with self.lock:
+            data = self.values.get(labels)
+            if data is None:
+                data = self.values[labels] = [0] * len(self.buckets) + [0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    data[index] += 1
+            data[-2] += value
+            data[-1] += 1
+
+    def samples(self):
+        result = []
+        with self.lock:
+            for labels, data in self.values.items():
+                for bound, count in zip(self.buckets, data):
+                    result.append((f"{self.name}_bucket", _format_labels(self.labelnames + ("le",), labels + (bound,)), count))
+                result.append((f"{self.name}_bucket", _format_labels(self.labelnames + ("le",), labels + ("+Inf",)), data[-1]))
+                result.append((f"{self.name}_sum", _format_labels(self.labelnames, labels), data[-2]))
+                result.append((f"{self.name}_count", _format_labels(self.labelnames, labels), data[-1]))
+        return result
+
+
+registry = []
+
+http_requests_total = Counter("http_requests_total", "HTTP requests by route and status", ("method", "route", "status"))
+http_request_duration = Histogram("http_request_duration_seconds", "HTTP request latency", ("method", "route"))
+http_requests_in_flight = Gauge("http_requests_in_flight", "HTTP requests being processed right now")
+http_requests_rejected = Counter("http_requests_rejected_total", "Requests turned away by admission control", ("reason",))
+db_queries_total = Counter("db_queries_total", "SQL statements executed")
+db_query_duration = Histogram("db_query_duration_seconds", "Time of a single SQL statement")
+request_db_queries = Histogram("http_request_db_queries", "SQL statements per HTTP request", ("route",), buckets=COUNT_BUCKETS)
+request_db_duration = Histogram("http_request_db_seconds", "Total DB time per HTTP request", ("route",))
+password_hash_duration = Histogram("password_hash_duration_seconds", "Time spent hashing/verifying one password", ("operation",))
+db_pool_connections = Gauge("db_pool_connections", "Pooled DB connections by state", ("pool", "state"))
+db_pool_checkout_wait = Counter("db_pool_checkout_wait_seconds_total", "Total time spent waiting for a pooled connection")
+db_pool_checkout_timeouts = Counter("db_pool_checkout_timeouts_total", "Checkouts that timed out waiting for a connection")
+change_feed_subscribers = Gauge("change_feed_subscribers", "Open /products/changes streams")
+change_feed_dropped = Counter("change_feed_dropped_total", "Change feed subscribers dropped for falling behind")
+jobs_processed = Counter("jobs_total", "Background jobs by kind and result (ok, retried, failed, dropped)", ("kind", "result"))
+job_lag = Histogram("job_lag_seconds", "Time from enqueueing a background job until it starts", ("kind",))
+job_queue_depth = Gauge("job_queue_depth", "Background jobs waiting to run")
+log_records_dropped = Counter("log_records_dropped_total", "Log records dropped because the log queue was full")
+
+
+# ---------------- PER REQUEST COUNTERS ----------------
+
+# {"db_queries": int, "db_seconds": float, "hash_seconds": float} for the current request.
+# A dict so that code running in threadpool threads updates the same object.
+request_stats = contextvars.ContextVar("request_stats", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    db_queries_total.inc()
+    db_query_duration.observe(value=elapsed)
+
+    stats = request_stats.get()
+    if stats is not None:
+        stats["db_queries"] += 1
+        stats["db_seconds"] += elapsed
+
+
+# Listen on every engine queries can go to: the primary, the read replicas and, in DB_ASYNC mode,
+# the sync cores of their async engines
+for _engine in (
+    engine,
+    *replica_engines,
+    *([async_engine.sync_engine] if async_engine is not None else []),
+    *[replica.sync_engine for replica in async_replica_engines],
+):
+    event.listen(_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def record_password_hash(operation: str, seconds: float):
+    password_hash_duration.observe(operation, value=seconds)
+
+
+def add_request_hash_time(seconds: float):
+    stats = request_stats.get()
+    if stats is not None:
+        stats["hash_seconds"] += seconds
+
+
+# ---------------- MIDDLEWARE ----------------
+
+def _dump_profile(profiler: cProfile.Profile, request: Request, route: str, elapsed: float):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = route.strip("/").replace("/", "_").replace("{", "").replace("}", "") or "root"
+    path = os.path.join(PROFILE_DIR, f"{datetime.now():%Y%m%d-%H%M%S-%f}_{request.method}_{name}.prof")
+    profiler.dump_stats(path)
+    logger.warning(f"Slow request {request.method} {route} took {elapsed * 1000:.0f} ms, profile saved to {path}")
+
+
+_profiler_active = False
+
+
+# Records latency, status, in-flight count and DB/hash time for every request.
+# Adds a Server-Timing header so the browser dev tools show where the time went.
+async def metrics_middleware(request: Request, call_next):
+    stats = {"db_queries": 0, "db_seconds": 0.0, "hash_seconds": 0.0}
+    token = request_stats.set(stats)
+
+    # cProfile only sees the event loop thread, so DB work done in the threadpool shows up as waiting time.
+    # Only one profiler can run per thread, so concurrent requests are simply not profiled.
+    global _profiler_active
+    profiler = None
+    if SLOW_REQUEST_PROFILE and not _profiler_active:
+        _profiler_active = True
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    http_requests_in_flight.inc(amount=1)
+    started = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        elapsed = time.perf_counter() - started
+        response.headers["Server-Timing"] = (
+            f"db;dur={stats['db_seconds'] * 1000:.1f}, hash;dur={stats['hash_seconds'] * 1000:.1f}, total;dur={elapsed * 1000:.1f}"
+        )
+        return response
+    finally:
+        elapsed = time.perf_counter() - started
+        http_requests_in_flight.inc(amount=-1)
+        request_stats.reset(token)
+
+        # Use the route template so /products/1 and /products/2 are one series
+        route = request.scope.get("route")
+        route = route.path if route is not None else "unmatched"
+        http_requests_total.inc(request.method, route, str(status_code))
+        http_request_duration.observe(request.method, route, value=elapsed)
+        request_db_queries.observe(route, value=stats["db_queries"])
+        request_db_duration.observe(route, value=stats["db_seconds"])
+
+        if profiler:
+            profiler.disable()
+            _profiler_active = False
+            if elapsed * 1000 >= SLOW_REQUEST_THRESHOLD_MS:
+                _dump_profile(profiler, request, route, elapsed)
+
+
+# ---------------- EXPORT ----------------
+
+def _update_gauges():
+    pools = get_pool_status()
+    for name, pool in pools.items():
+        if name == "checkout_wait" or "checked_out" not in pool:
+            continue
+        db_pool_connections.set(name, "checked_out", value=pool["checked_out"])
+        db_pool_connections.set(name, "checked_in", value=pool["checked_in"])
+        db_pool_connections.set(name, "overflow", value=pool["overflow"])
+    db_pool_checkout_wait.set_total(value=pools["checkout_wait"]["wait_seconds_total"])
+    db_pool_checkout_timeouts.set_total(value=pools["checkout_wait"]["timeouts"])
+    log_records_dropped.set_total(value=queue_handler.dropped)
+
+
+# All metrics in Prometheus text exposition format
+def render_metrics():
+    _update_gauges()
+    lines = []
+    for metric in registry:
+        lines.append(f"# HELP {metric.name} {metric.help_text}")
+        lines.append(f"# TYPE {metric.name} {metric.type_name}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{labels} {value}")
+    return "\n".join(lines) + "\n"
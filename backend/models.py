@@ -1,4 +1,6 @@
-from sqlalchemy import Column, Integer, String, Float
+from datetime import datetime, timezone
+
+from sqlalchemy import Column, Integer, BigInteger, String, Float, DateTime, Index, text
 from backend.database import Base
 from backend.enums import UserRole
 
@@ -11,6 +13,16 @@ class Product(Base):
     description = Column(String)
     price = Column(Float, nullable=False)
     quantity = Column(Integer, nullable=False)
+    version = Column(Integer, nullable=False, default=1, server_default="1") # +1 on every write, sent as the ETag for If-Match
+
+    __table_args__ = (
+        Index("ix_product_quantity_id", "quantity", "id"), # GET /products/low-stock: range scan on quantity
+        # Top products by stock value in /products/stats (Postgres needs the extra parentheses around an expression)
+        Index("ix_product_stock_value", text("(price * quantity) DESC")),
+        # Never reuse the id of a deleted product on SQLite: a new row would start at version 1 again and
+        # a stale ETag ("<version>") for the old product would match it
+        {"sqlite_autoincrement": True},
+    )
 
 
 class User(Base):
@@ -22,3 +34,39 @@ class User(Base):
     hashed_password = Column(String, nullable=False)
     email = Column(String)
     role = Column(String, default=UserRole.USER.value, nullable=False)
+
+    __table_args__ = (
+        Index("ix_user_table_role_id", "role", "id"), # GET /users?role=... pages through this index
+    )
+
+
+# Append-only ledger of stock changes. Rows are never updated or deleted, and product_id is not a
+# foreign key on purpose so the history of a product is kept even after the product is deleted.
+class StockMovement(Base):
+    __tablename__ = "stock_movement"
+
+    id = Column(Integer, primary_key=True)
+    product_id = Column(Integer, nullable=False)
+    delta = Column(Integer, nullable=False) # positive = stock in, negative = stock out
+    quantity_after = Column(Integer, nullable=False) # product quantity right after this movement
+    reason = Column(String)
+    user_id = Column(Integer) # who made the change
+    created_at = Column(DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (
+        Index("ix_stock_movement_product_id", "product_id", "id"),  # GET /products/{id}/movements
+    )
+
+
+# Catalog totals for GET /products/stats, split over SUMMARY_SHARDS rows (id = product id % shards) that are
+# summed on read. Every product write adds its change to its shard in the same transaction, so reading the
+# stats never scans the product table, and concurrent writes to different products don't wait on one row lock.
+class InventorySummary(Base):
+    __tablename__ = "inventory_summary"
+
+    id = Column(Integer, primary_key=True)
+    product_count = Column(Integer, nullable=False, default=0)
+    total_quantity = Column(BigInteger, nullable=False, default=0)
+    total_value = Column(Float, nullable=False, default=0) # SUM(price * quantity)
+    out_of_stock_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc))
@@ -0,0 +1,187 @@
+import csv
+import io
+import json
+
+from pydantic import ValidationError
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+import backend.models as models
+from backend.database import session, upsert_insert
+from backend.json_response import dumps
+from backend.product_query import PRODUCT_COLUMNS
+from backend.response_cache import bump_catalog_version
+from backend.schemas import ProductCreate
+
+CSV_COLUMNS = ["id", "name", "description", "price", "quantity", "version"]
+IMPORT_CHUNK_SIZE = 500  # rows validated and written per INSERT statement
+EXPORT_BATCH_SIZE = 1000  # rows fetched per round trip from the server side cursor
+MAX_REPORTED_ERRORS = 1000  # failed rows are still counted after this, just not listed
+
+
+# ---------------- IMPORT ----------------
+
+# Turn the streamed request body into complete lines without reading the whole body into memory
+async def iter_lines(byte_stream):
+    buffer = b""
+    async for chunk in byte_stream:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8-sig").rstrip("\r")
+    if buffer:
+        yield buffer.decode("utf-8-sig").rstrip("\r")
+
+
+# Yields (row_number, dict) for every record of a CSV body. The first record is the header.
+async def iter_csv_records(byte_stream):
+    header = None
+    pending = ""
+    row_number = 0
+    async for line in iter_lines(byte_stream):
+        # A quoted field can contain a newline: keep joining lines until the quotes are balanced
+        pending = f"{pending}\n{line}" if pending else line
+        if pending.count('"') % 2 == 1:
+            continue
+
+        record, pending = pending, ""
+        if not record.strip():
+            continue
+
+        values = next(csv.reader([record]))
+        if header is None:
+            header = [column.strip().lower() for column in values]
+            continue
+
+        row_number += 1
+        yield row_number, dict(zip(header, values))
+
+
+# Yields (row_number, dict) for every line of a NDJSON body. Broken JSON is passed on as an error string.
+async def iter_ndjson_records(byte_stream):
+    row_number = 0
+    async for line in iter_lines(byte_stream):
+        if not line.strip():
+            continue
+
+        row_number += 1
+        try:
+            yield row_number, json.loads(line)
+        except json.JSONDecodeError as e:
+            yield row_number, f"Invalid JSON: {e.msg}"
+
+
+# Validate one raw record with the same rules as POST /products. Returns (product, error_message).
+def validate_record(record):
+    if isinstance(record, str):
+        return None, record
+    if not isinstance(record, dict):
+        return None, "Row must be an object"
+
+    if record.get("description") == "":
+        record["description"] = None  # empty CSV cell means no description
+
+    try:
+        product = ProductCreate.model_validate(record)
+    except ValidationError as e:
+        return None, "; ".join(f"{'.'.join(str(loc) for loc in err['loc'])}: {err['msg']}" for err in e.errors())
+
+    product.name = product.name.strip().title()
+    return product, None
+
+
+def _upsert_statement(db: Session, rows: list[dict]):
+    insert = upsert_insert(db)
+    statement = insert(models.Product).values(rows)
+    # Same name means same product: update it instead of failing on the unique constraint
+    return statement.on_conflict_do_update(
+        index_elements=[models.Product.name],
+        set_={
+            "description": statement.excluded.description,
+            "price": statement.excluded.price,
+            "quantity": statement.excluded.quantity,
+            "version": models.Product.version + 1,
+        },
+    )
+
+
+# Write a chunk of validated rows with one INSERT ... ON CONFLICT statement.
+# rows is a list of (row_number, product). Returns (upserted_count, errors).
+def upsert_chunk(db: Session, rows: list):
+    # A name can appear only once per statement (Postgres refuses to update the same row twice), so the
+    # n-th occurrence of every name goes into the n-th statement: repeated names are applied in file order
+    statements = []
+    occurrences = {}
+    for row_number, product in rows:
+        index = occurrences.get(product.name, 0)
+        occurrences[product.name] = index + 1
+        if index == len(statements):
+            statements.append([])
+        statements[index].append(product.model_dump())
+
+    try:
+        for values in statements:
+            db.execute(_upsert_statement(db, values))
+        db.commit()
+        bump_catalog_version()
+        return len(rows), []
+    except SQLAlchemyError:
+        db.rollback()
+
+    # The batch failed as a whole, retry row by row so only the bad rows are reported
+    upserted = 0
+    errors = []
+    for row_number, product in rows:
+        try:
+            db.execute(_upsert_statement(db, [product.model_dump()]))
+            db.commit()
+            upserted += 1
+        except SQLAlchemyError as e:
+            db.rollback()
+            errors.append({"row": row_number, "message": str(e.orig) if getattr(e, "orig", None) else str(e)})
+
+    if upserted:
+        bump_catalog_version()
+    return upserted, errors
+
+
+# ---------------- EXPORT ----------------
+
+# Stream every product from a server side cursor, EXPORT_BATCH_SIZE rows at a time.
+# Uses its own session because the response is still being streamed after the route function returned.
+def iter_export_rows():
+    db = session()
+    try:
+        query = db.query(*PRODUCT_COLUMNS).order_by(models.Product.id).yield_per(EXPORT_BATCH_SIZE)
+
+        for row in query:
+            yield row._asdict()
+    finally:
+        db.close()
+
+
+def export_csv():
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=CSV_COLUMNS)
+
+    writer.writeheader()
+    for count, row in enumerate(iter_export_rows(), start=1):
+        writer.writerow(row)
+        if count % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue()
+
+
+def export_ndjson():
+    lines = []
+    for row in iter_export_rows():
+        lines.append(dumps(row))
+        if len(lines) == EXPORT_BATCH_SIZE:
+            yield b"\n".join(lines) + b"\n"
+            lines = []
+
+    if lines:
+        yield b"\n".join(lines) + b"\n"
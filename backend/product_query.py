@@ -0,0 +1,94 @@
+from sqlalchemy import String, cast, func, or_
+from sqlalchemy.orm import Session
+
+import backend.models as models
+from backend.exceptions import AppException
+
+
+# Columns of ProductResponse, in response order. Selecting just these returns plain rows instead of
+# ORM objects (no identity map, no change tracking), which is most of the cost of a big page.
+PRODUCT_COLUMNS = (
+    models.Product.id,
+    models.Product.name,
+    models.Product.description,
+    models.Product.price,
+    models.Product.quantity,
+    models.Product.version,
+)
+PRODUCT_FIELDS = {column.key: column for column in PRODUCT_COLUMNS}
+
+
+# Columns for a ?fields= list like "name,quantity", so only those are selected and serialized.
+# id is always included: it identifies the row and is the cursor of the next page.
+def select_columns(fields: str | None):
+    if not fields:
+        return PRODUCT_COLUMNS
+
+    names = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = names - PRODUCT_FIELDS.keys()
+    if unknown:
+        raise AppException(f"Unknown field(s): {', '.join(sorted(unknown))}. Allowed: {', '.join(PRODUCT_FIELDS)}", 400)
+    return tuple(column for column in PRODUCT_COLUMNS if column.key == "id" or column.key in names)
+
+
+# Build the WHERE clause for the product search box.
+# Same matching rules as the old Python filter (name, description, id, price) but evaluated by the DB,
+# so we never load rows that are not going to be returned.
+def build_search_filter(search: str):
+    search_lower = search.lower()
+    return or_(
+        func.lower(models.Product.name).contains(search_lower, autoescape=True),
+        func.lower(models.Product.description).contains(search_lower, autoescape=True),  # NULL description simply doesn't match
+        cast(models.Product.id, String).contains(search_lower, autoescape=True),
+        cast(models.Product.price, String).contains(search_lower, autoescape=True),
+    )
+
+
+# Fetch one page of products.
+# If cursor (last seen product id) is given we use keyset pagination (WHERE id > cursor) which stays fast on deep pages,
+# otherwise we fall back to classic LIMIT/OFFSET based on page number.
+def get_products_page(db: Session, search: str | None, page: int, limit: int, cursor: int | None = None,
+                      include_total: bool = False, columns: tuple = PRODUCT_COLUMNS):
+    query = db.query(*columns)
+    if search:
+        query = query.filter(build_search_filter(search))
+
+    total = query.count() if include_total else None
+
+    query = query.order_by(models.Product.id)
+    if cursor is not None:
+        query = query.filter(models.Product.id > cursor)
+    else:
+        query = query.offset((page - 1) * limit)
+
+    # Ask for one extra row so we know if there is a next page without running a COUNT(*)
+    rows = query.limit(limit + 1).all()
+    has_more = len(rows) > limit
+    items = [row._asdict() for row in rows[:limit]]
+
+    return {
+        "items": items,
+        "page": page,
+        "limit": limit,
+        "has_more": has_more,
+        "next_cursor": items[-1]["id"] if has_more else None,
+        "total": total,
+    }
+
+
+# Products by id or by name in a single IN (...) query, returned in the order they were asked for.
+# keys that don't match a product are returned in missing.
+def get_products_batch(db: Session, key_column, keys: list, columns: tuple = PRODUCT_COLUMNS):
+    key_selected = any(column.key == key_column.key for column in columns)
+    rows = db.query(*columns, *(() if key_selected else (key_column,))).filter(key_column.in_(keys)).all()
+
+    found = {}
+    for row in rows:
+        product = row._asdict()
+        key = product[key_column.key] if key_selected else product.pop(key_column.key)
+        found[key] = product
+
+    return {
+        "items": [found[key] for key in keys if key in found],
+        "missing": [key for key in keys if key not in found],
+    }
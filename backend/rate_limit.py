@@ -0,0 +1,193 @@
+import math
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+from fastapi import Request
+from fastapi.responses import JSONResponse
+
+from backend.auth_config import verify_access_token
+from backend.cache import TTLCache
+from backend.logging_config import logger
+from backend.metrics import http_requests_rejected
+
+load_dotenv()
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+# Token bucket per client: RATE_LIMIT_BURST tokens at most, refilled at RATE_LIMIT_PER_SECOND tokens/second.
+# Every request takes its route cost (see ROUTE_COSTS) from the bucket, an empty bucket means 429.
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "60"))
+RATE_LIMIT_PER_SECOND = float(os.getenv("RATE_LIMIT_PER_SECOND", "20"))
+RATE_LIMIT_MAX_CLIENTS = int(os.getenv("RATE_LIMIT_MAX_CLIENTS", "10000"))  # buckets kept in memory per worker
+# Share the buckets between workers/servers, e.g. redis://localhost:6379/1
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL")
+# Requests one worker handles at the same time, the rest get 503 right away instead of queueing
+# until every request is slow (0 = no cap)
+MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", "200"))
+OVERLOAD_RETRY_AFTER_SECONDS = 1
+
+# Monitoring must keep working while the API sheds load
+EXEMPT_PATHS = {"/", "/health", "/metrics", "/docs", "/redoc", "/openapi.json"}
+
+# (method, path prefix, cost), first match wins. A plain read costs 1 token, a login is bcrypt bound
+# and costs as much as ten reads. Method None matches any method.
+ROUTE_COSTS = [
+    ("POST", "/auth/logout", 1),  # no password hashing
+    ("POST", "/auth/", 10),
+    ("POST", "/users/bulk", 20),
+    ("POST", "/products/bulk", 20),
+    ("GET", "/products/export", 10),
+    ("GET", "/products/stats", 2),
+    ("GET", "/products/search", 2),
+]
+WRITE_COST = 2
+READ_COST = 1
+SEARCH_COST = 3  # GET /products?search= scans far more rows than a plain page
+
+
+def route_cost(request: Request):
+    method, path = request.method, request.url.path
+    for route_method, prefix, cost in ROUTE_COSTS:
+        if (route_method is None or route_method == method) and path.startswith(prefix):
+            return cost
+    if method in ("POST", "PUT", "PATCH", "DELETE"):
+        return WRITE_COST
+    if path.rstrip("/") == "/products" and request.query_params.get("search"):
+        return SEARCH_COST
+    return READ_COST
+
+
+# ---------------- BACKENDS ----------------
+
+# Default backend: buckets in process memory. Each worker limits on its own, so with N workers
+# a client can get up to N times the rate (use the Redis backend to share them).
+class LocalRateLimitBackend:
+    def __init__(self, burst: float, per_second: float, max_clients: int):
+        self.burst = burst
+        self.per_second = per_second
+        # A bucket left alone for burst / per_second seconds is full again, exactly like a new one,
+        # so it can simply expire. Evicting a busy client only hands it a full bucket early.
+        self.buckets = TTLCache(max_size=max_clients, ttl_seconds=burst / per_second)
+        self.lock = threading.Lock()
+
+    # Take cost tokens from the bucket of key. Returns 0 if they were taken, otherwise
+    # the seconds until the bucket holds enough of them.
+    def take(self, key: str, cost: float):
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated = self.buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.per_second)
+            if tokens < cost:
+                return (cost - tokens) / self.per_second
+            self.buckets.set(key, (tokens - cost, now))
+            return 0.0
+
+
+# Same bucket as above in one atomic Lua script, using the Redis clock so every worker agrees on the time
+_REDIS_TAKE_SCRIPT = """
+local burst = tonumber(ARGV[1])
+local per_second = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or burst
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * per_second)
+if tokens < cost then
+    return tostring((cost - tokens) / per_second)
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tokens - cost, 'updated', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / per_second) + 1)
+return '0'
+"""
+
+
+# Shared backend for multi-worker deployments. Needs: pip install redis
+class RedisRateLimitBackend:
+    KEY_PREFIX = "ratelimit:"
+
+    def __init__(self, url: str, burst: float, per_second: float):
+        import redis  # optional dependency, only needed when this backend is configured
+
+        self.client = redis.Redis.from_url(url)
+        self.burst = burst
+        self.per_second = per_second
+        self.script = self.client.register_script(_REDIS_TAKE_SCRIPT)
+
+    def take(self, key: str, cost: float):
+        return float(self.script(keys=[self.KEY_PREFIX + key], args=[self.burst, self.per_second, cost]))
+
+
+if RATE_LIMIT_REDIS_URL:
+    rate_limit_backend = RedisRateLimitBackend(RATE_LIMIT_REDIS_URL, RATE_LIMIT_BURST, RATE_LIMIT_PER_SECOND)
+else:
+    rate_limit_backend = LocalRateLimitBackend(RATE_LIMIT_BURST, RATE_LIMIT_PER_SECOND, RATE_LIMIT_MAX_CLIENTS)
+
+
+def set_rate_limit_backend(backend):
+    global rate_limit_backend
+    rate_limit_backend = backend
+
+
+# ---------------- MIDDLEWARE ----------------
+
+# Logged in clients are limited per user (all their devices share one bucket), everything else per IP.
+# /auth/* is always per IP, so a login flood is limited no matter which account it targets.
+# The decoded token is kept on the request, get_token_payload reuses it instead of decoding again.
+def client_key(request: Request):
+    authorization = request.headers.get("authorization", "")
+    if authorization[:7].lower() == "bearer " and not request.url.path.startswith("/auth/"):
+        token = authorization[7:]
+        payload = verify_access_token(token)
+        if payload is not None and payload.get("user_id") is not None:
+            request.state.token_payload = (token, payload)
+            return f"user:{payload['user_id']}"
+
+    # The launcher passes --forwarded-allow-ips, so behind a proxy this is already the real client address
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+
+def _reject(status_code: int, message: str, retry_after: float):
+    return JSONResponse(
+        status_code=status_code,
+        content={"message": message, "status_code": status_code},
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
+_in_flight = 0
+
+
+# Admission control in front of every route: first the worker wide concurrency cap (503),
+# then the client's token bucket (429). Both answer with Retry-After before any route work is done.
+async def rate_limit_middleware(request: Request, call_next):
+    global _in_flight
+    if not RATE_LIMIT_ENABLED or request.url.path in EXEMPT_PATHS:
+        return await call_next(request)
+
+    if MAX_CONCURRENT_REQUESTS and _in_flight >= MAX_CONCURRENT_REQUESTS:
+        http_requests_rejected.inc("overload")
+        return _reject(503, "Server is busy, please try again in a moment", OVERLOAD_RETRY_AFTER_SECONDS)
+
+    key = client_key(request)
+    # A cost above the burst could never be paid, cap it so such routes are just very expensive
+    try:
+        retry_after = rate_limit_backend.take(key, min(route_cost(request), RATE_LIMIT_BURST))
+    except Exception as e:
+        # A shared backend that is down must not take the API down with it
+        logger.warning(f"Rate limit backend failed, request let through: {e}")
+        retry_after = 0.0
+
+    if retry_after > 0:
+        http_requests_rejected.inc("rate_limit")
+        return _reject(429, "Too many requests, please slow down", retry_after)
+
+    _in_flight += 1
+    try:
+        return await call_next(request)
+    finally:
+        _in_flight -= 1
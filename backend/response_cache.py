@@ -0,0 +1,163 @@
+import hashlib
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+from fastapi import Request, Response
+
+from backend.cache import TTLCache
+from backend.database import REPLICA_STICKY_SECONDS, is_recent_writer, replica_engines, request_client
+from backend.jobs import enqueue_job
+
+load_dotenv()
+
+RESPONSE_CACHE_MAX_SIZE = int(os.getenv("RESPONSE_CACHE_MAX_SIZE", "2048"))
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "30"))
+# Share the cache (and the catalog version) between workers/servers, e.g. redis://localhost:6379/0
+RESPONSE_CACHE_REDIS_URL = os.getenv("RESPONSE_CACHE_REDIS_URL")
+
+
+# Default backend: in-process LRU. Each worker has its own copy, so another worker's write is
+# seen here at the latest after RESPONSE_CACHE_TTL_SECONDS.
+class LocalCacheBackend:
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.entries = TTLCache(max_size=max_size, ttl_seconds=ttl_seconds)
+        self.version = 0
+        self.lock = threading.Lock()
+
+    def get(self, key: str):
+        return self.entries.get(key)
+
+    def set(self, key: str, value: tuple[str, bytes]):
+        self.entries.set(key, value)
+
+    def get_version(self):
+        return self.version
+
+    def bump_version(self):
+        with self.lock:
+            self.version += 1
+
+
+# Shared backend for multi-worker deployments. Needs: pip install redis
+class RedisCacheBackend:
+    VERSION_KEY = "products:catalog_version"
+
+    def __init__(self, url: str, ttl_seconds: float):
+        import redis  # optional dependency, only needed when this backend is configured
+
+        self.client = redis.Redis.from_url(url)
+        self.ttl_seconds = int(ttl_seconds)
+
+    def get(self, key: str):
+        data = self.client.get(key)
+        if data is None:
+            return None
+        etag, body = data.split(b"\n", 1)
+        return etag.decode(), body
+
+    def set(self, key: str, value: tuple[str, bytes]):
+        etag, body = value
+        self.client.set(key, etag.encode() + b"\n" + body, ex=self.ttl_seconds)
+
+    def get_version(self):
+        return int(self.client.get(self.VERSION_KEY) or 0)
+
+    def bump_version(self):
+        self.client.incr(self.VERSION_KEY)
+
+
+if RESPONSE_CACHE_REDIS_URL:
+    cache_backend = RedisCacheBackend(RESPONSE_CACHE_REDIS_URL, RESPONSE_CACHE_TTL_SECONDS)
+else:
+    cache_backend = LocalCacheBackend(RESPONSE_CACHE_MAX_SIZE, RESPONSE_CACHE_TTL_SECONDS)
+
+
+def set_cache_backend(backend):
+    global cache_backend
+    cache_backend = backend
+
+
+# Called by every product write. The version is part of every cache key, so bumping it
+# makes all cached product pages unreachable at once (old entries just age out).
+# This part stays inline: the writer's next read must not be served the page from before its write.
+# Re-warming the cache is a background job (see warm_product_cache).
+def bump_catalog_version():
+    global _last_bump
+    cache_backend.bump_version()
+    _last_bump = time.monotonic()
+    enqueue_job("catalog.changed")
+
+
+_last_bump = 0.0
+
+
+def cache_key(kind: str, *parts):
+    return f"products:v{cache_backend.get_version()}:{kind}:{parts!r}"
+
+
+def make_etag(body: bytes):
+    return '"' + hashlib.sha1(body).hexdigest() + '"'
+
+
+# ETag of a row that has a version column: changes exactly when the row changes
+def version_etag(version: int):
+    return f'"{version}"'
+
+
+# Versions the client accepts from an If-Match header, or None if there is no precondition (no header or "*").
+# An empty list means nothing can match, the write must fail with 412.
+# If-Match uses the strong comparison (RFC 9110 13.1.1): a weak tag W/"..." never matches.
+def parse_if_match(if_match: str | None):
+    if if_match is None or if_match.strip() == "*":
+        return None
+    versions = []
+    for tag in if_match.split(","):
+        tag = tag.strip()
+        if tag.startswith('"') and tag.endswith('"') and tag[1:-1].isdigit():
+            versions.append(int(tag[1:-1]))
+    return versions
+
+
+def _etag_matches(if_none_match: str | None, etag: str):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in [tag.strip() for tag in if_none_match.split(",")]
+
+
+# Put a JSON body in the cache under key, also used to warm the cache at startup.
+# The ETag is a hash of the body unless the caller has a better one (e.g. a version number).
+def store_json(key: str, body: bytes, etag: str | None = None):
+    entry = (etag or make_etag(body), body)
+    cache_backend.set(key, entry)
+    return entry
+
+
+# Serve a JSON response from the cache, or build it with load() (an awaitable returning the JSON bytes,
+# or an (etag, body) tuple) and cache it.
+# If the client already has this exact body (If-None-Match) we answer 304 without a body.
+# With read replicas, a client that just wrote skips the cache: its reads go to the primary, but the cache could
+# hold a body a lagging replica built before the write. For the same reason bodies built shortly after a write
+# are only cached when they were read from the primary.
+async def cached_json_response(request: Request, key: str, load):
+    bypass = bool(replica_engines) and is_recent_writer(request_client(request))
+    entry = None if bypass else cache_backend.get(key)
+    if entry is None:
+        loaded = await load()
+        etag, body = loaded if isinstance(loaded, tuple) else (None, loaded)
+        if not replica_engines or bypass or time.monotonic() - _last_bump >= REPLICA_STICKY_SECONDS:
+            entry = store_json(key, body, etag)
+        else:
+            entry = (etag or make_etag(body), body)
+
+    etag, body = entry
+    # private: response depends on the Authorization header, no-cache: browser must revalidate (cheap with the ETag)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -1,10 +1,14 @@
+from sqlalchemy import update
 from sqlalchemy.exc import IntegrityError
 from fastapi import APIRouter, Depends, status
 from sqlalchemy.orm import Session
 
-from backend.auth_config import verify_password, hash_password, create_access_token
-from backend.database import get_db
+from backend.auth_config import (
+    hash_password_async, verify_and_update_password_async, create_access_token, get_token_payload, invalidate_user, revoke_token,
+)
+from backend.database import AnySession, get_session, run_db, session, use_primary
 from backend.exceptions import AppException
+from backend.jobs import enqueue_job, register_job
 from backend.logging_config import logger
 from backend.schemas import UserResponse, UserCreate, UserLogin
 import backend.models as models
@@ -15,16 +19,24 @@ router = APIRouter(prefix="/auth", tags=["Auth"])
 
 # To register a new user
 @router.post("/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-def register_user(user: UserCreate, db: Session = Depends(get_db)):
+async def register_user(user: UserCreate, db: AnySession = Depends(get_session)):
+    # Hashing runs in the password hash pool, DB work runs through run_db so the event loop never blocks
+    hashed_password = await hash_password_async(user.password)
+    return await run_db(db, _create_user, user, hashed_password)
+
+
+def _create_user(db: Session, user: UserCreate, hashed_password: str):
     # db_user = models.User(user.model_dump()) # why this dont work : model and dto password field name mismatch
 
-    # Check if this is the very first user in the database
-    is_first_user = db.query(models.User).count() == 0
+    # The very first user becomes admin. EXISTS stops at the first row it finds, COUNT(*) would read the whole table.
+    # Asked on the primary: a lagging replica could still look empty and hand out a second admin role.
+    use_primary(db)
+    is_first_user = not db.query(db.query(models.User.id).exists()).scalar()
 
     db_user = models.User(
         name=user.name,
         username=user.username.strip().lower(),
-        hashed_password=hash_password(user.password),
+        hashed_password=hashed_password,
         email=user.email.strip().lower(),
         role=UserRole.ADMIN if is_first_user else UserRole.USER
     )
@@ -41,11 +53,22 @@ def register_user(user: UserCreate, db: Session = Depends(get_db)):
 
 # To login a user
 @router.post("/login", status_code=status.HTTP_200_OK)
-def login(user_credentials: UserLogin, db: Session = Depends(get_db)):
-    db_user = db.query(models.User).filter(models.User.username == user_credentials.username).first()
+async def login(user_credentials: UserLogin, db: AnySession = Depends(get_session)):
+    db_user = await run_db(
+        db, lambda db: db.query(models.User).filter(models.User.username == user_credentials.username).first()
+    )
 
     # if user exists and password matches
-    if db_user and verify_password(user_credentials.password, db_user.hashed_password):
+    if db_user:
+        is_valid, new_hash = await verify_and_update_password_async(user_credentials.password, db_user.hashed_password)
+    else:
+        is_valid, new_hash = False, None
+
+    if is_valid:
+        # Stored hash uses old scheme/cost settings, replace it now that we know the plain password.
+        # Saved by a background job, the login response doesn't depend on it.
+        if new_hash:
+            enqueue_job("user.password_rehash", (db_user.id, new_hash))
 
         # create access token by passing user id and username as dict in payload and return bearer access token.
         token = create_access_token({
@@ -63,3 +86,28 @@ def login(user_credentials: UserLogin, db: Session = Depends(get_db)):
         }
 
     raise AppException("Invalid username or password", 401)
+
+
+# To logout: the token is revoked right away instead of staying valid until it expires
+@router.post("/logout", status_code=status.HTTP_200_OK)
+async def logout(payload: dict = Depends(get_token_payload)):
+    revoke_token(payload)
+    logger.info(f"User logged out: {payload.get('username')}")
+    return {"message": "Logged out"}
+
+
+# Upgraded hashes of every login since the last run, saved with one UPDATE by primary key
+def _save_password_hashes(payloads: list):
+    db = session(info={"primary": True})
+    try:
+        db.execute(update(models.User), [{"id": user_id, "hashed_password": new_hash} for user_id, new_hash in payloads])
+        db.commit()
+    finally:
+        db.close()
+
+    for user_id, _ in payloads:
+        invalidate_user(user_id)
+    logger.info(f"Password hash upgraded for {len(payloads)} user(s)")
+
+
+register_job("user.password_rehash", _save_password_hashes)
@@ -1,148 +1,438 @@
+from typing import Literal
+
+from sqlalchemy import delete, insert, update
 from sqlalchemy.exc import IntegrityError
 
-from fastapi import APIRouter, Depends, status
+from fastapi import APIRouter, Depends, Query, Request, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 
-from backend.database import get_db
+from backend.database import AnySession, get_session, run_db, session
 from backend.exceptions import AppException
+from backend.json_response import ORJSONResponse, dumps
 from backend.logging_config import logger
-from backend.schemas import ProductResponse, ProductCreate, ProductUpdate
+from backend.schemas import (
+    ProductResponse, ProductCreate, ProductUpdate, ProductPage, ProductBatch, BulkImportResult,
+    StockAdjustment, StockAdjustmentBatch, StockMovementResponse, InventoryStats,
+)
+from backend.product_query import PRODUCT_COLUMNS, get_products_batch, get_products_page, select_columns
+from backend.search_index import search_products
+from backend.stock import apply_stock_adjustments, get_stock_movements
+from backend.change_feed import publish_change, stream_changes
+from backend.jobs import register_job
+from backend.inventory_stats import LOW_STOCK_THRESHOLD, get_inventory_stats, get_low_stock
+from backend.response_cache import (
+    bump_catalog_version, cache_key, cached_json_response, parse_if_match, store_json, version_etag,
+)
+from backend.product_io import (
+    IMPORT_CHUNK_SIZE, MAX_REPORTED_ERRORS, export_csv, export_ndjson,
+    iter_csv_records, iter_ndjson_records, upsert_chunk, validate_record,
+)
 import backend.models as models
-from backend.auth_config import RoleChecker
+from backend.auth_config import RoleChecker, get_current_user
 from backend.enums import UserRole
 
 
 router = APIRouter(prefix="/products", tags=["Products"])
 
+BATCH_MAX_SIZE = 500  # ids/names per GET /products/batch, also keeps the URL under common proxy limits
+FIELDS_DESCRIPTION = "Comma separated columns to return, e.g. name,quantity (id is always included)"
+
 # Get all products
-@router.get("/", response_model=list[ProductResponse], status_code=status.HTTP_200_OK)
-def get_all_products(
-    db: Session = Depends(get_db),
+@router.get("/", response_model=ProductPage, status_code=status.HTTP_200_OK)
+async def get_all_products(
+    request: Request,
+    db: AnySession = Depends(get_session),
     search: str | None = None,
-    page: int = 1,
-    limit: int = 10
+    page: int = Query(1, ge=1),
+    limit: int = Query(10, ge=1, le=100),
+    cursor: int | None = Query(None, description="Last product id of the previous page (keyset pagination)"),
+    include_total: bool = False,
+    fields: str | None = Query(None, description=FIELDS_DESCRIPTION)
+):
+    columns = select_columns(fields)
+    # Pages are cached until the next product write, and answered with 304 if the client's ETag still matches
+    key = cache_key("list", search, page, limit, cursor, include_total, *[column.key for column in columns])
+    return await cached_json_response(
+        request, key, lambda: run_db(db, _get_products_page_json, search, page, limit, cursor, include_total, columns)
+    )
+
+
+def _get_products_page_json(db: Session, search: str | None, page: int, limit: int, cursor: int | None, include_total: bool,
+                            columns: tuple = PRODUCT_COLUMNS):
+    # Search and pagination are done in SQL, only the requested page is loaded from the DB
+    result = get_products_page(db, search, page, limit, cursor, include_total, columns)
+    # logger.info(f"Retrieved {len(result['items'])} products (page {page}, limit {limit})")
+    # Rows come straight from the product columns, they are serialized as they are (no per-item validation)
+    return dumps(result)
+
+
+# Cache the first page the way the dashboard asks for it, so the first visitor after a restart doesn't pay for it
+def warm_product_cache(db: Session):
+    key = cache_key("list", None, 1, 10, None, False, *[column.key for column in PRODUCT_COLUMNS])
+    store_json(key, _get_products_page_json(db, None, 1, 10, None, False))
+
+
+# Background job after product writes: warm the first page again so the next visitor doesn't pay for it.
+# A burst of writes (e.g. a bulk import) queues many of these, they are handled with a single warm up.
+def _rewarm_product_cache(payloads: list):
+    db = session(info={"primary": True})
+    try:
+        warm_product_cache(db)
+    finally:
+        db.close()
+
+
+register_job("catalog.changed", _rewarm_product_cache, on_dropped=lambda: _rewarm_product_cache([]))
+
+
+# Many products in one request and one IN (...) query, instead of one GET /products/{id} per product.
+# Items come back in the order they were asked for, ids/names without a product are listed in missing.
+@router.get("/batch", response_model=ProductBatch, status_code=status.HTTP_200_OK)
+async def get_products_by_ids(
+    ids: list[str] = Query([], description="Product ids, comma separated and/or repeated: ?ids=1,2&ids=3"),
+    names: list[str] = Query([], description="Product names instead of ids, repeated only since names may contain commas: ?names=Widget&names=Bolt, M6"),
+    fields: str | None = Query(None, description=FIELDS_DESCRIPTION),
+    db: AnySession = Depends(get_session)
 ):
-    products = db.query(models.Product).order_by(models.Product.id).all()
+    columns = select_columns(fields)
+    if bool(ids) == bool(names):
+        raise AppException("Pass either ids or names", 400)
+
+    if ids:
+        try:
+            keys = [int(value) for value in _split_values(ids)]
+        except ValueError:
+            raise AppException("ids must be integers", 400)
+        _check_batch_size(keys)
+        return ORJSONResponse(await run_db(db, get_products_batch, models.Product.id, keys, columns))
+
+    # Names are stored the way POST /products saves them (stripped, title case), match them the same way
+    asked = {value.strip().title(): value for value in _unique_values(names)}
+    _check_batch_size(asked)
+    result = await run_db(db, get_products_batch, models.Product.name, list(asked), columns)
+    result["missing"] = [asked[name] for name in result["missing"]]
+    return ORJSONResponse(result)
+
+
+# Values of a list query parameter that may also be comma separated, without duplicates, in order
+def _split_values(values: list[str]):
+    return _unique_values(part for value in values for part in value.split(","))
 
-    # If a search query is provided, filter products based on name, description, id, or price
-    if search: 
-        search_lower = search.lower()
-        products = [
-            p for p in products 
-            if search_lower in p.name.lower() or
-               (p.description and (search_lower in p.description.lower())) or # Handle case where description might be None
-               search_lower in str(p.id) or
-               search_lower in str(p.price)
-        ]
 
-    start = (page - 1) * limit
-    end = start + limit
-    # logger.info(f"Retrieved {len(products)} products (page {page}, limit {limit})")
-    return [p for p in products[start:end]]
+# Non-blank values without duplicates, in order
+def _unique_values(values):
+    return list(dict.fromkeys(value.strip() for value in values if value.strip()))
+
+
+def _check_batch_size(keys):
+    if len(keys) > BATCH_MAX_SIZE:
+        raise AppException(f"At most {BATCH_MAX_SIZE} products per batch", 400)
+
+
+# Ranked search (best match first) backed by the full-text index, supports prefixes like "wid" for "Widget"
+@router.get("/search", response_model=list[ProductResponse], status_code=status.HTTP_200_OK)
+async def search_products_ranked(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(10, ge=1, le=100),
+    db: AnySession = Depends(get_session)
+):
+    return ORJSONResponse(await run_db(db, search_products, q, limit))
+
+
+# Catalog totals (count, units, stock value, out of stock), low-stock count and the top products by stock value.
+# Totals come from the summary row kept up to date by every write, nothing here scans the product table.
+@router.get("/stats", response_model=InventoryStats, status_code=status.HTTP_200_OK)
+async def get_product_stats(
+    request: Request,
+    threshold: int = Query(LOW_STOCK_THRESHOLD, ge=0),
+    top: int = Query(5, ge=0, le=50),
+    db: AnySession = Depends(get_session)
+):
+    return await cached_json_response(
+        request, cache_key("stats", threshold, top), lambda: run_db(db, _get_stats_json, threshold, top)
+    )
+
+
+def _get_stats_json(db: Session, threshold: int, top: int):
+    return dumps(get_inventory_stats(db, threshold, top))
+
+
+# Products that need restocking (quantity <= threshold), lowest quantity first
+@router.get("/low-stock", response_model=list[ProductResponse], status_code=status.HTTP_200_OK)
+async def get_low_stock_products(
+    threshold: int = Query(LOW_STOCK_THRESHOLD, ge=0),
+    page: int = Query(1, ge=1),
+    limit: int = Query(50, ge=1, le=500),
+    db: AnySession = Depends(get_session)
+):
+    return ORJSONResponse(await run_db(db, get_low_stock, threshold, page, limit))
+
+
+# Live feed of product changes as Server-Sent Events, so clients can update what they show instead of re-polling.
+# Events: product.created / product.updated (the changed fields, always with id), product.deleted ({id}),
+# products.reload (after a bulk import) and reset (events were missed, reload everything).
+# A reconnecting client sends Last-Event-ID (EventSource does it by itself) and first gets what it missed.
+@router.get("/changes", status_code=status.HTTP_200_OK)
+async def product_changes(
+        request: Request,
+        last_event_id: str | None = Query(None, description="Resume after this event id, same as the Last-Event-ID header")
+):
+    last_event_id = request.headers.get("last-event-id") or last_event_id
+    return StreamingResponse(
+        stream_changes(last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},  # no proxy buffering (nginx)
+    )
+
+
+# Export the whole catalog as CSV or NDJSON. Rows are streamed from a server side cursor so the catalog is never held in memory.
+@router.get("/export", status_code=status.HTTP_200_OK, dependencies=[Depends(RoleChecker([UserRole.ADMIN]))])
+def export_products(format: Literal["csv", "ndjson"] = "csv"):
+    if format == "ndjson":
+        return StreamingResponse(export_ndjson(), media_type="application/x-ndjson",
+                                 headers={"Content-Disposition": "attachment; filename=products.ndjson"})
+
+    return StreamingResponse(export_csv(), media_type="text/csv",
+                             headers={"Content-Disposition": "attachment; filename=products.csv"})
 
 
 @router.get("/{product_id}", response_model=ProductResponse, status_code=status.HTTP_200_OK)
-def get_product_by_id(
+async def get_product_by_id(
+        request: Request,
         product_id: int,
-        db: Session = Depends(get_db)
+        db: AnySession = Depends(get_session)
 ):
-    prod = db.query(models.Product).filter(models.Product.id == product_id).first()
-    if not prod:
+    return await cached_json_response(
+        request, cache_key("product", product_id), lambda: run_db(db, _get_product_entry, product_id)
+    )
+
+
+# (etag, body) of one product. The ETag is the row version, so it can be sent back as If-Match on a write.
+def _get_product_entry(db: Session, product_id: int):
+    row = db.query(*PRODUCT_COLUMNS).filter(models.Product.id == product_id).first()
+    if not row:
         raise AppException("Product not found", 404)
 
     # logger.info(f"Product retrieved: {prod.id} - {prod.name}")
-    return prod
+    return version_etag(row.version), dumps(row._asdict())
+
+
+# Response for a single written product, with its new version as ETag
+def _product_response(product: dict, status_code: int = status.HTTP_200_OK):
+    return ORJSONResponse(product, status_code=status_code, headers={"ETag": version_etag(product["version"])})
+
+
+# Write one product with a single UPDATE/DELETE ... WHERE id = :id [AND version IN (:if_match)] RETURNING ...
+# No row back means the product doesn't exist, or it was changed since the client read it (If-Match): 404 or 412.
+def _write_product(db: Session, statement, product_id: int, versions: list[int] | None):
+    statement = statement.where(models.Product.id == product_id)
+    if versions is not None:
+        statement = statement.where(models.Product.version.in_(versions))
+
+    row = db.execute(statement.returning(*PRODUCT_COLUMNS)).first()
+    if row is None:
+        db.rollback()
+        # Only on the error path: find out which of the two it was
+        if versions is not None and db.query(models.Product.id).filter(models.Product.id == product_id).first():
+            raise AppException("Product was changed by someone else, reload it and try again", 412)
+        raise AppException(f"Product with id: {product_id} not found", 404)
+
+    db.commit()
+    bump_catalog_version()
+    return row._asdict()
 
 
 # Post method to save a product
 @router.post("/", response_model=ProductResponse, status_code=status.HTTP_201_CREATED, dependencies=[Depends(RoleChecker([UserRole.ADMIN]))])
-def save_product(
+async def save_product(
         product: ProductCreate,
-        db: Session = Depends(get_db)
+        db: AnySession = Depends(get_session)
 ):
+    product = await run_db(db, _save_product, product)
+    publish_change("product.created", product)
+    return _product_response(product, status.HTTP_201_CREATED)
+
+
+def _save_product(db: Session, product: ProductCreate):
     product.name = product.name.strip().title()
-    db_product = models.Product(**product.model_dump())
     try:
-        db.add(db_product)
+        # INSERT ... RETURNING gives back the id and defaults, no refresh() SELECT needed
+        row = db.execute(insert(models.Product).values(**product.model_dump()).returning(*PRODUCT_COLUMNS)).first()
         db.commit()
-        db.refresh(db_product)  #Reload the object from the database to capture updated auto-generated fields (like ID).
-        logger.info(f"Product created: {db_product.id} - {db_product.name}")
-        return db_product
-
     except IntegrityError:
         db.rollback()
         raise AppException(f"Product with the name {product.name} already exists", 409)
 
+    bump_catalog_version()
+    logger.info(f"Product created: {row.id} - {row.name}")
+    return row._asdict()
+
+
+# Bulk import products from a streamed CSV (header: name,description,price,quantity) or NDJSON body.
+# Rows are validated like POST /products and written in chunks with INSERT ... ON CONFLICT (name) DO UPDATE,
+# invalid rows are reported back without stopping the import.
+@router.post("/bulk", response_model=BulkImportResult, status_code=status.HTTP_200_OK, dependencies=[Depends(RoleChecker([UserRole.ADMIN]))])
+async def bulk_import_products(
+        request: Request,
+        format: Literal["csv", "ndjson"] | None = None,
+        db: AnySession = Depends(get_session)
+):
+    if format is None:
+        format = "ndjson" if "json" in request.headers.get("content-type", "") else "csv"
+    records = iter_ndjson_records(request.stream()) if format == "ndjson" else iter_csv_records(request.stream())
+
+    upserted = 0
+    failed = 0
+    errors = []
+    chunk = []
+
+    def add_errors(new_errors):
+        nonlocal failed
+        failed += len(new_errors)
+        errors.extend(new_errors[:MAX_REPORTED_ERRORS - len(errors)])
+
+    async for row_number, record in records:
+        product, message = validate_record(record)
+        if message:
+            add_errors([{"row": row_number, "message": message}])
+            continue
+
+        chunk.append((row_number, product))
+        if len(chunk) >= IMPORT_CHUNK_SIZE:
+            # DB work runs off the event loop so it keeps reading the body of other requests
+            count, chunk_errors = await run_db(db, upsert_chunk, chunk)
+            upserted += count
+            add_errors(chunk_errors)
+            chunk = []
+
+    if chunk:
+        count, chunk_errors = await run_db(db, upsert_chunk, chunk)
+        upserted += count
+        add_errors(chunk_errors)
+
+    logger.info(f"Bulk import finished: {upserted} upserted, {failed} failed")
+    if upserted:
+        # Too many rows for one event each, subscribers just reload what they show
+        publish_change("products.reload", {"upserted": upserted})
+    return {"upserted": upserted, "failed": failed, "errors": errors}
+
+
+# Change stock of many products in one transaction (e.g. a whole pick list). All lines succeed or none do.
+@router.post("/adjust", response_model=list[StockMovementResponse], status_code=status.HTTP_200_OK, dependencies=[Depends(RoleChecker([UserRole.ADMIN]))])
+async def adjust_stock_batch(
+        batch: StockAdjustmentBatch,
+        db: AnySession = Depends(get_session),
+        current_user: models.User = Depends(get_current_user)
+):
+    items = [(item.product_id, item.delta) for item in batch.items]
+    movements = await run_db(db, apply_stock_adjustments, items, batch.reason, current_user.id)
+    _publish_stock_changes(movements)
+    logger.info(f"Stock adjusted for {len(movements)} products by {current_user.username}")
+    return movements
+
+
+# Add or remove stock of one product. Done with a single atomic UPDATE so concurrent adjustments never lose updates.
+@router.post("/{product_id}/adjust", response_model=StockMovementResponse, status_code=status.HTTP_200_OK, dependencies=[Depends(RoleChecker([UserRole.ADMIN]))])
+async def adjust_stock(
+        product_id: int,
+        adjustment: StockAdjustment,
+        db: AnySession = Depends(get_session),
+        current_user: models.User = Depends(get_current_user)
+):
+    movements = await run_db(db, apply_stock_adjustments, [(product_id, adjustment.delta)], adjustment.reason, current_user.id)
+    _publish_stock_changes(movements)
+    logger.info(f"Stock adjusted: {product_id} by {adjustment.delta} (now {movements[0]['quantity_after']})")
+    return movements[0]
+
+
+def _publish_stock_changes(movements: list[dict]):
+    for movement in movements:
+        publish_change("product.updated", {"id": movement["product_id"], "quantity": movement["quantity_after"]})
+
 
-# Put method to update a product
+# Stock history of a product, newest first
+@router.get("/{product_id}/movements", response_model=list[StockMovementResponse], status_code=status.HTTP_200_OK)
+async def get_product_movements(
+        product_id: int,
+        limit: int = Query(50, ge=1, le=500),
+        before_id: int | None = Query(None, description="Last movement id of the previous page"),
+        db: AnySession = Depends(get_session)
+):
+    return await run_db(db, get_stock_movements, product_id, limit, before_id)
+
+
+# Put method to update a product. Send If-Match: "<version>" to get 412 instead of overwriting a newer change.
 @router.put("/{product_id}", response_model=ProductResponse, status_code=status.HTTP_200_OK, dependencies=[Depends(RoleChecker([UserRole.ADMIN]))])
-def update_product(
+async def update_product(
+        request: Request,
         product_id : int,
         product : ProductUpdate,
-        db: Session = Depends(get_db)
+        db: AnySession = Depends(get_session)
 ):
-    db_product = db.query(models.Product).filter(models.Product.id == product_id).first()
-    if not db_product:
-        raise AppException(f"Product with id: {product_id} not found", 404)
-
-    try:
-        product.name = product.name.strip().title()
+    versions = parse_if_match(request.headers.get("if-match"))
+    product = await run_db(db, _update_product, product_id, product, versions)
+    publish_change("product.updated", product)
+    return _product_response(product)
 
-        db_product.name = product.name
-        db_product.description = product.description
-        db_product.price = product.price
-        db_product.quantity = product.quantity
-        db.commit()
-        db.refresh(db_product)
-        logger.info(f"Product updated: {db_product.id} - {db_product.name}")
-        return db_product
 
+def _update_product(db: Session, product_id: int, product: ProductUpdate, versions: list[int] | None):
+    product.name = product.name.strip().title()
+    statement = update(models.Product).values(**product.model_dump(), version=models.Product.version + 1)
+    try:
+        row = _write_product(db, statement, product_id, versions)
     except IntegrityError:
         db.rollback()
         raise AppException(f"Product with the name {product.name} already exists", 409)
 
+    logger.info(f"Product updated: {row['id']} - {row['name']}")
+    return row
+
 
 @router.patch("/{product_id}", response_model=ProductResponse, status_code=status.HTTP_200_OK, dependencies=[Depends(RoleChecker([UserRole.ADMIN]))])
-def patch_product(
+async def patch_product(
+        request: Request,
         product_id: int,
         product: ProductUpdate,
-        db: Session = Depends(get_db)
+        db: AnySession = Depends(get_session)
 ):
-    db_product = db.query(models.Product).filter(models.Product.id == product_id).first()
-    if not db_product:
-        raise AppException(f"Product with id: {product_id} not found", 404)
-
-    try:
-        if product.name:
-            product.name = product.name.strip().title()
+    versions = parse_if_match(request.headers.get("if-match"))
+    product = await run_db(db, _patch_product, product_id, product, versions)
+    publish_change("product.updated", product)
+    return _product_response(product)
 
-        # Get dict of only the fields that the user actually sent in RequestBody
-        update_data = product.model_dump(exclude_unset=True)
 
-        for key, value in update_data.items():
-            setattr(db_product, key, value)
-
-        db.commit()
-        db.refresh(db_product)
-        logger.info(f"Product updated: {db_product.id} - {db_product.name}")
-        return db_product
+def _patch_product(db: Session, product_id: int, product: ProductUpdate, versions: list[int] | None):
+    if product.name:
+        product.name = product.name.strip().title()
 
+    # Get dict of only the fields that the user actually sent in RequestBody
+    update_data = product.model_dump(exclude_unset=True)
+    statement = update(models.Product).values(**update_data, version=models.Product.version + 1)
+    try:
+        row = _write_product(db, statement, product_id, versions)
     except IntegrityError:
         db.rollback()
         raise AppException(f"Product with the name {product.name} already exists", 409)
 
+    logger.info(f"Product updated: {row['id']} - {row['name']}")
+    return row
+
 
 # Delete method to delete a product
 @router.delete("/{product_id}", response_model=ProductResponse, status_code=status.HTTP_200_OK, dependencies=[Depends(RoleChecker([UserRole.ADMIN]))])
-def delete_product_by_id(
+async def delete_product_by_id(
+        request: Request,
         product_id: int,
-        db: Session = Depends(get_db)
+        db: AnySession = Depends(get_session)
 ):
-    db_product = db.query(models.Product).filter(models.Product.id == product_id).first()
-    if not db_product:
-        raise AppException(f"Product with id: {product_id} not found", 404)
+    versions = parse_if_match(request.headers.get("if-match"))
+    product = await run_db(db, _delete_product_by_id, product_id, versions)
+    publish_change("product.deleted", {"id": product["id"]})
+    return ORJSONResponse(product)
 
-    db.delete(db_product)
-    db.commit()
-    logger.info(f"Product deleted: {db_product.id} - {db_product.name}")
-    return db_product
+
+def _delete_product_by_id(db: Session, product_id: int, versions: list[int] | None):
+    row = _write_product(db, delete(models.Product), product_id, versions)
+    logger.info(f"Product deleted: {row['id']} - {row['name']}")
+    return row
@@ -1,35 +1,152 @@
 from sqlalchemy.exc import IntegrityError
-from fastapi import APIRouter, Depends, status
+from fastapi import APIRouter, Depends, Query, status
 from sqlalchemy.orm import Session
 
-from backend.database import get_db
-from backend.auth_config import hash_password, get_current_user
+from backend.database import AnySession, get_session, run_db, upsert_insert
+from backend.auth_config import hash_password_async, hash_passwords_async, get_current_user, invalidate_user, revoke_user_tokens
 from backend.exceptions import AppException
+from backend.json_response import ORJSONResponse
 from backend.logging_config import logger
-from backend.schemas import UserResponse, UserCreate, UserUpdate
+from backend.schemas import UserResponse, UserCreate, UserUpdate, UserPage, UserBulkCreate, UserBulkResult
 import backend.models as models
 from backend.auth_config import RoleChecker
 from backend.enums import UserRole
 
 router = APIRouter(prefix="/users", tags=["Users"])
 
-# Get all users
-@router.get("/", response_model=list[UserResponse], status_code=status.HTTP_200_OK, dependencies=[Depends(RoleChecker([UserRole.ADMIN]))])
-def get_all_users(db: Session = Depends(get_db)):
-    users = db.query(models.User).order_by(models.User.id).all()
-    return users
+USER_INSERT_CHUNK_SIZE = 500  # users per INSERT statement in POST /users/bulk
+
+# Get all users, one page at a time (keyset pagination on id), optionally filtered by role and username prefix
+@router.get("/", response_model=UserPage, status_code=status.HTTP_200_OK, dependencies=[Depends(RoleChecker([UserRole.ADMIN]))])
+async def get_all_users(
+    limit: int = Query(50, ge=1, le=200),
+    cursor: int | None = Query(None, description="Last user id of the previous page"),
+    role: UserRole | None = None,
+    username_prefix: str | None = Query(None, min_length=1, max_length=30),
+    db: AnySession = Depends(get_session)
+):
+    # Normalized before use, a prefix that is only whitespace means no filter
+    username_prefix = (username_prefix or "").strip().lower() or None
+    return ORJSONResponse(await run_db(db, _get_users_page, limit, cursor, role, username_prefix))
+
+
+def _get_users_page(db: Session, limit: int, cursor: int | None, role: UserRole | None, username_prefix: str | None):
+    # Select only the columns UserResponse needs (never hashed_password), rows are not turned into ORM objects
+    query = db.query(models.User.id, models.User.name, models.User.username, models.User.email, models.User.role)
+
+    if cursor is not None:
+        query = query.filter(models.User.id > cursor)
+    if role is not None:
+        query = query.filter(models.User.role == role.value)
+    if username_prefix:
+        # Range instead of LIKE 'abc%' so the normal index on username can be used on every DB
+        upper_bound = username_prefix[:-1] + chr(ord(username_prefix[-1]) + 1)
+        query = query.filter(models.User.username >= username_prefix, models.User.username < upper_bound)
+
+    # One extra row tells us if there is a next page
+    rows = query.order_by(models.User.id).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    items = [row._asdict() for row in rows[:limit]]
+
+    return {
+        "items": items,
+        "limit": limit,
+        "has_more": has_more,
+        "next_cursor": items[-1]["id"] if has_more else None,
+    }
+
+
+# Create many users at once (Admin only). Usernames already taken, or repeated in the request, are reported
+# per row instead of failing the whole batch. Passwords are hashed in parallel on the hash pool and the
+# users are written with a few multi-row INSERTs.
+@router.post("/bulk", response_model=UserBulkResult, status_code=status.HTTP_200_OK, dependencies=[Depends(RoleChecker([UserRole.ADMIN]))])
+async def bulk_create_users(batch: UserBulkCreate, db: AnySession = Depends(get_session)):
+    rows = [
+        {
+            "row": row_number,
+            "name": user.name,
+            "username": user.username.strip().lower(),
+            "email": user.email.strip().lower(),
+            "password": user.password,
+        }
+        for row_number, user in enumerate(batch.users, start=1)
+    ]
+
+    # Find the conflicts first so we don't spend a hash on users that can't be created
+    rows, errors = await run_db(db, _filter_conflicts, rows)
+
+    hashes = await hash_passwords_async([row.pop("password") for row in rows])
+    for row, hashed_password in zip(rows, hashes):
+        row["hashed_password"] = hashed_password
+
+    created, insert_errors = await run_db(db, _insert_users, rows)
+    errors = sorted(errors + insert_errors, key=lambda error: error["row"])
+
+    logger.info(f"Bulk user import: {len(created)} created, {len(errors)} failed")
+    return {"created": len(created), "failed": len(errors), "users": created, "errors": errors}
+
+
+def _filter_conflicts(db: Session, rows: list[dict]):
+    existing = set()
+    usernames = [row["username"] for row in rows]
+    for start in range(0, len(usernames), USER_INSERT_CHUNK_SIZE):
+        chunk = usernames[start:start + USER_INSERT_CHUNK_SIZE]
+        existing.update(username for (username,) in db.query(models.User.username).filter(models.User.username.in_(chunk)))
+
+    accepted = []
+    errors = []
+    for row in rows:
+        if row["username"] in existing:
+            errors.append({"row": row["row"], "message": f"User with username {row['username']} already exists"})
+        else:
+            existing.add(row["username"])  # a second row with the same username in this request is a conflict too
+            accepted.append(row)
+    return accepted, errors
+
+
+def _insert_users(db: Session, rows: list[dict]):
+    insert = upsert_insert(db)
+    created = []
+    errors = []
+    for start in range(0, len(rows), USER_INSERT_CHUNK_SIZE):
+        chunk = rows[start:start + USER_INSERT_CHUNK_SIZE]
+        # DO NOTHING + RETURNING: a username taken since _filter_conflicts (concurrent registration)
+        # just doesn't come back, instead of failing the whole statement
+        statement = (
+            insert(models.User)
+            .values([
+                {key: row[key] for key in ("name", "username", "email", "hashed_password")} | {"role": UserRole.USER.value}
+                for row in chunk
+            ])
+            .on_conflict_do_nothing(index_elements=[models.User.username])
+            .returning(models.User.id, models.User.name, models.User.username, models.User.email, models.User.role)
+        )
+        inserted = {user.username: user._asdict() for user in db.execute(statement)}
+        db.commit()
+
+        for row in chunk:
+            user = inserted.get(row["username"])
+            if user is None:
+                errors.append({"row": row["row"], "message": f"User with username {row['username']} already exists"})
+            else:
+                created.append(user)
+    return created, errors
 
 
 # Get current logged-in user profile
 @router.get("/me", response_model=UserResponse, status_code=status.HTTP_200_OK)
-def get_my_profile(current_user: models.User = Depends(get_current_user)):
+async def get_my_profile(current_user: models.User = Depends(get_current_user)):
     # The dependency already validates token and fetch user from DB
     return current_user
 
 
 # Get user by ID
 @router.get("/{user_id}", response_model=UserResponse, status_code=status.HTTP_200_OK)
-def get_user_by_id(user_id: int, db: Session = Depends(get_db)):
+async def get_user_by_id(user_id: int, db: AnySession = Depends(get_session)):
+    return await run_db(db, _get_user_by_id, user_id)
+
+
+def _get_user_by_id(db: Session, user_id: int):
     user = db.query(models.User).filter(models.User.id == user_id).first()
     if not user:
         raise AppException("User not found", 404)
@@ -38,24 +155,29 @@ def get_user_by_id(user_id: int, db: Session = Depends(get_db)):
 
 # Update a user
 @router.put("/{user_id}", response_model=UserResponse, status_code=status.HTTP_200_OK)
-def update_user(user_id: int, user: UserUpdate, db: Session = Depends(get_db)):
-    db_user = db.query(models.User).filter(models.User.id == user_id).first()
+async def update_user(user_id: int, user: UserUpdate, db: AnySession = Depends(get_session)):
+    db_user = await run_db(db, lambda db: db.query(models.User).filter(models.User.id == user_id).first())
     if not db_user:
         raise AppException(f"User with id: {user_id} not found", 404)
 
-    try:
-        update_data = user.model_dump(exclude_unset=True)
-        if "password" in update_data:
-            # Remove plain password from dict
-            plain_password = update_data.pop("password")
-            # Hash password and map it to DB field because model and dto password field name mismatch
-            update_data["hashed_password"] = hash_password(plain_password)
+    update_data = user.model_dump(exclude_unset=True)
+    if "password" in update_data:
+        # Remove plain password from dict
+        plain_password = update_data.pop("password")
+        # Hash password (in the password hash pool) and map it to DB field because model and dto password field name mismatch
+        update_data["hashed_password"] = await hash_password_async(plain_password)
+
+    return await run_db(db, _apply_user_update, db_user, update_data)
 
+
+def _apply_user_update(db: Session, db_user: models.User, update_data: dict):
+    try:
         for key, value in update_data.items():
             setattr(db_user, key, value)
 
         db.commit()
         db.refresh(db_user)
+        invalidate_user(db_user.id)
         logger.info(f"User updated: {db_user.id} - {db_user.username}")
         return db_user
     except IntegrityError:
@@ -65,10 +187,14 @@ def update_user(user_id: int, user: UserUpdate, db: Session = Depends(get_db)):
 
 # Change a user's role (Admin only)
 @router.patch("/{user_id}/role", response_model=UserResponse, status_code=status.HTTP_200_OK, dependencies=[Depends(RoleChecker([UserRole.ADMIN]))])
-def change_user_role(user_id: int, role: UserRole, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+async def change_user_role(user_id: int, role: UserRole, db: AnySession = Depends(get_session), current_user: models.User = Depends(get_current_user)):
     if user_id == current_user.id:
         raise AppException("You cannot change your own role", 400)
 
+    return await run_db(db, _change_user_role, user_id, role, current_user)
+
+
+def _change_user_role(db: Session, user_id: int, role: UserRole, current_user: models.User):
     db_user = db.query(models.User).filter(models.User.id == user_id).first()
     if not db_user:
         raise AppException(f"User with id: {user_id} not found", 404)
@@ -76,20 +202,28 @@ def change_user_role(user_id: int, role: UserRole, db: Session = Depends(get_db)
     db_user.role = role
     db.commit()
     db.refresh(db_user)
+    invalidate_user(db_user.id)
+    revoke_user_tokens(db_user.id)  # their tokens carry the old role claim, they log in again to get the new one
     logger.info(f"User {db_user.id} role updated to {role} by {current_user.username}")
     return db_user
 
 # Delete a user by ID (Admin only) 
 @router.delete("/{user_id}", response_model=UserResponse, status_code=status.HTTP_200_OK, dependencies=[Depends(RoleChecker([UserRole.ADMIN]))])
-def delete_user_by_id(user_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+async def delete_user_by_id(user_id: int, db: AnySession = Depends(get_session), current_user: models.User = Depends(get_current_user)):
     if user_id == current_user.id:
         raise AppException("You cannot delete yourself", 400)
 
+    return await run_db(db, _delete_user_by_id, user_id)
+
+
+def _delete_user_by_id(db: Session, user_id: int):
     db_user = db.query(models.User).filter(models.User.id == user_id).first()
     if not db_user:
         raise AppException(f"User with id: {user_id} not found", 404)
 
     db.delete(db_user)
     db.commit()
+    invalidate_user(db_user.id)
+    revoke_user_tokens(db_user.id)
     logger.info(f"User deleted: {db_user.id} - {db_user.username}")
     return db_user
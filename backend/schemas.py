@@ -1,6 +1,7 @@
-from pydantic import BaseModel, Field
+from pydantic import AfterValidator, BaseModel, Field
 from backend.enums import UserRole
-from typing import Optional
+from typing import Annotated, Optional
+from datetime import datetime
 
 # For creating a new product (POST)
 class ProductCreate(BaseModel):
@@ -23,11 +24,92 @@ class ProductResponse(BaseModel):
     description: Optional[str] = None
     price: float
     quantity: int
+    version: int # changes on every write, send it back as If-Match: "<version>" to avoid overwriting someone else's edit
 
     model_config = {
         "from_attributes": True
     }
 
+# For returning one page of products (GET /products)
+class ProductPage(BaseModel):
+    items: list[ProductResponse]
+    page: int
+    limit: int
+    has_more: bool # True if there is at least one more product after this page
+    next_cursor: Optional[int] = None # Pass as ?cursor= to fetch the next page with keyset pagination
+    total: Optional[int] = None # Only filled when ?include_total=true because COUNT(*) is expensive on big tables
+
+# For returning products looked up by id or name (GET /products/batch), in the order they were asked for
+class ProductBatch(BaseModel):
+    items: list[ProductResponse] # only the ?fields= columns (and id) when fields is given
+    missing: list[int | str] # ids or names that matched no product
+
+
+# One row that could not be imported by POST /products/bulk
+class BulkRowError(BaseModel):
+    row: int # 1-based data row number (CSV header not counted)
+    message: str
+
+# Result of POST /products/bulk
+class BulkImportResult(BaseModel):
+    upserted: int # rows inserted or updated (matched on product name)
+    failed: int
+    errors: list[BulkRowError] # at most the first 1000 errors are listed
+
+
+def _not_zero(value: int):
+    if value == 0:
+        raise ValueError("Delta cannot be 0")
+    return value
+
+# A stock change of 0 would only write a ledger row and bump the product version
+StockDelta = Annotated[int, AfterValidator(_not_zero)]
+
+# For changing the stock of one product (POST /products/{id}/adjust)
+class StockAdjustment(BaseModel):
+    delta: StockDelta = Field(..., description="Quantity to add (positive) or remove (negative)")
+    reason: Optional[str] = Field(None, max_length=200)
+
+# One line of a batch adjustment (e.g. a pick list)
+class StockAdjustmentItem(BaseModel):
+    product_id: int
+    delta: StockDelta
+
+# For changing the stock of many products at once (POST /products/adjust)
+class StockAdjustmentBatch(BaseModel):
+    items: list[StockAdjustmentItem] = Field(..., min_length=1, max_length=1000)
+    reason: Optional[str] = Field(None, max_length=200)
+
+# For returning stock ledger entries
+class StockMovementResponse(BaseModel):
+    id: int
+    product_id: int
+    delta: int
+    quantity_after: int
+    reason: Optional[str] = None
+    user_id: Optional[int] = None
+    created_at: datetime
+
+    model_config = {
+        "from_attributes": True
+    }
+
+
+# A product with its stock value (price * quantity)
+class ProductStockValue(ProductResponse):
+    stock_value: float
+
+# For returning catalog totals (GET /products/stats)
+class InventoryStats(BaseModel):
+    product_count: int
+    total_quantity: int
+    total_value: float # SUM(price * quantity)
+    out_of_stock_count: int
+    low_stock_threshold: int
+    low_stock_count: int # products with quantity <= low_stock_threshold
+    top_by_value: list[ProductStockValue]
+    updated_at: datetime # last change of the totals
+
 
 # For creating a new user
 class UserCreate(BaseModel):
@@ -36,6 +118,10 @@ class UserCreate(BaseModel):
     password: str = Field(..., min_length=6)
     email: str = Field(..., pattern=r"^\S+@\S+\.\S+$")
 
+# For creating many users at once (POST /users/bulk), e.g. staff accounts from an HR export
+class UserBulkCreate(BaseModel):
+    users: list[UserCreate] = Field(..., min_length=1, max_length=1000)
+
 # For logging in
 class UserLogin(BaseModel):
     username: str = Field(..., min_length=1)
@@ -59,3 +145,17 @@ class UserResponse(BaseModel):
     model_config = {
         "from_attributes": True
     }
+
+# For returning one page of users (GET /users)
+class UserPage(BaseModel):
+    items: list[UserResponse]
+    limit: int
+    has_more: bool
+    next_cursor: Optional[int] = None # Pass as ?cursor= to get the next page
+
+# Result of POST /users/bulk
+class UserBulkResult(BaseModel):
+    created: int
+    failed: int
+    users: list[UserResponse] # the created users, in request order
+    errors: list[BulkRowError] # row = 1-based position in the request's users list
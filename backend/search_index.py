@@ -0,0 +1,152 @@
+import re
+
+from sqlalchemy import column, func, literal, or_, table, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+import backend.models as models
+from backend.logging_config import logger
+from backend.product_query import PRODUCT_COLUMNS, build_search_filter
+
+# Which search backend is active, decided once at startup by ensure_search_index():
+# "postgres" -> tsvector + pg_trgm GIN indexes, "fts5" -> SQLite FTS5 table, None -> plain LIKE scan
+search_backend = None
+
+# The FTS5 table for joins, same columns (PRODUCT_COLUMNS) on every search path
+_product_fts = table("product_fts", column("rowid"))
+
+
+# Create the search indexes for the current database.
+# Everything is idempotent (IF NOT EXISTS) so it is safe to call on every startup.
+def ensure_search_index(engine: Engine):
+    global search_backend
+
+    try:
+        if engine.dialect.name == "postgresql":
+            _create_postgres_index(engine)
+            search_backend = "postgres"
+        elif engine.dialect.name == "sqlite":
+            _create_sqlite_index(engine)
+            search_backend = "fts5"
+    except Exception as e:
+        # e.g. no permission to CREATE EXTENSION or SQLite built without FTS5. Search still works, just unindexed.
+        logger.warning(f"Search index not available, falling back to LIKE search: {e}")
+        search_backend = None
+
+
+# Pick the search backend from what already exists, without running any DDL.
+# Used by workers when the launcher has already created the schema in the parent process.
+def detect_search_backend(engine: Engine):
+    global search_backend
+
+    with engine.connect() as conn:
+        if engine.dialect.name == "postgresql":
+            found = conn.execute(text(
+                "SELECT 1 FROM pg_indexes WHERE indexname = 'ix_product_search_tsv' "
+                "AND EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')"
+            )).first()
+            search_backend = "postgres" if found else None
+        elif engine.dialect.name == "sqlite":
+            found = conn.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'product_fts'")).first()
+            search_backend = "fts5" if found else None
+
+
+def _create_postgres_index(engine: Engine):
+    with engine.begin() as conn:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        # Full-text index for ranked word / prefix search
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_product_search_tsv ON product "
+            "USING gin (to_tsvector('simple', coalesce(name, '') || ' ' || coalesce(description, '')))"
+        ))
+        # Trigram indexes for typo tolerant matching, they also speed up the LIKE '%...%' search of GET /products
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_product_name_trgm ON product USING gin (lower(name) gin_trgm_ops)"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_product_description_trgm ON product USING gin (lower(description) gin_trgm_ops)"))
+
+
+def _create_sqlite_index(engine: Engine):
+    with engine.begin() as conn:
+        exists = conn.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'product_fts'")).first()
+
+        # External content table: FTS5 only stores the index, the text itself stays in the product table
+        conn.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS product_fts USING fts5("
+            "name, description, content='product', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+        ))
+
+        # Triggers keep the index in sync with every insert/update/delete on product,
+        # no matter which route (or bulk statement) changed the row.
+        conn.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS product_fts_insert AFTER INSERT ON product BEGIN "
+            "INSERT INTO product_fts(rowid, name, description) VALUES (new.id, new.name, new.description); END"
+        ))
+        conn.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS product_fts_delete AFTER DELETE ON product BEGIN "
+            "INSERT INTO product_fts(product_fts, rowid, name, description) VALUES ('delete', old.id, old.name, old.description); END"
+        ))
+        conn.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS product_fts_update AFTER UPDATE OF name, description ON product BEGIN "
+            "INSERT INTO product_fts(product_fts, rowid, name, description) VALUES ('delete', old.id, old.name, old.description); "
+            "INSERT INTO product_fts(rowid, name, description) VALUES (new.id, new.name, new.description); END"
+        ))
+
+        # First time the index is created on an existing database, fill it from the product table
+        if not exists:
+            conn.execute(text("INSERT INTO product_fts(product_fts) VALUES ('rebuild')"))
+
+
+# Split user input into plain words, this also strips any FTS / tsquery operators the user might type
+def _terms(query: str):
+    return re.findall(r"\w+", query.lower())
+
+
+# Ranked product search, best match first. Returns plain dicts with the ProductResponse fields.
+def search_products(db: Session, query: str, limit: int = 10):
+    terms = _terms(query)
+    if not terms:
+        return []
+
+    if search_backend == "postgres":
+        return _search_postgres(db, query.lower(), terms, limit)
+    if search_backend == "fts5":
+        return _search_sqlite(db, terms, limit)
+
+    rows = db.query(*PRODUCT_COLUMNS).filter(build_search_filter(query)).order_by(models.Product.id).limit(limit).all()
+    return [row._asdict() for row in rows]
+
+
+def _search_postgres(db: Session, query: str, terms: list[str], limit: int):
+    # Expressions must match the ones used in the index definitions, otherwise Postgres will not use the index
+    document = func.to_tsvector(
+        "simple",
+        func.coalesce(models.Product.name, "") + " " + func.coalesce(models.Product.description, "")
+    )
+    ts_query = func.to_tsquery("simple", " & ".join(f"{term}:*" for term in terms))  # every word, prefix match
+    name_lower = func.lower(models.Product.name)
+
+    # Full-text rank + trigram similarity, so "wdget" still finds "Widget"
+    rank = func.ts_rank(document, ts_query) + func.word_similarity(query, name_lower)
+
+    rows = (
+        db.query(*PRODUCT_COLUMNS)
+        .filter(or_(document.op("@@")(ts_query), literal(query).op("<%")(name_lower)))
+        .order_by(rank.desc(), models.Product.id)
+        .limit(limit)
+        .all()
+    )
+    return [row._asdict() for row in rows]
+
+
+def _search_sqlite(db: Session, terms: list[str], limit: int):
+    # "word"* is a prefix query in FTS5, space between them means AND
+    match = " ".join(f'"{term}"*' for term in terms)
+    rows = (
+        db.query(*PRODUCT_COLUMNS)
+        .join(_product_fts, _product_fts.c.rowid == models.Product.id)
+        .filter(text("product_fts MATCH :match"))
+        .order_by(text("bm25(product_fts)"), models.Product.id)
+        .limit(limit)
+        .params(match=match)
+        .all()
+    )
+    return [row._asdict() for row in rows]
@@ -0,0 +1,134 @@
+"""Production launcher.
+
+Creates the schema once in this (parent) process, then starts the workers with
+DB_INIT_ON_STARTUP=false so they skip the DDL and only warm their pool and caches.
+
+    python -m backend.server --workers 4 --port 8000
+    python -m backend.server --gunicorn --workers 4     # gunicorn + uvicorn workers, app preloaded (pip install gunicorn)
+
+Workers default to WEB_CONCURRENCY, or the number of CPUs. Some state lives in each worker's memory
+unless a shared (Redis) backend is configured for it, see SHARED_STATE: without those settings the
+launcher runs one worker and refuses to start more.
+"""
+import argparse
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+APP = "backend.main:app"
+
+# (setting that moves the state to a shared backend, what separate workers would disagree on without it)
+SHARED_STATE = [
+    ("RESPONSE_CACHE_REDIS_URL", "product pages and 304s would stay stale on the other workers after a write"),
+    ("CHANGE_FEED_REDIS_URL", "live tables would miss every change made through another worker"),
+    ("TOKEN_REVOCATION_REDIS_URL", "logged out and demoted users' tokens would keep working on the other workers"),
+]
+
+
+def unshared_state():
+    return [(name, problem) for name, problem in SHARED_STATE if not os.getenv(name)]
+
+
+# WEB_CONCURRENCY or one worker per CPU, but only one worker while any state is still per worker
+def default_workers():
+    if os.getenv("WEB_CONCURRENCY"):
+        return int(os.getenv("WEB_CONCURRENCY"))
+    return 1 if unshared_state() else os.cpu_count() or 1
+
+
+# Run the DDL here so N workers don't race to do it. The parent's connections are closed
+# afterwards, pooled connections must never be shared with forked workers.
+def prepare_database():
+    import backend.lifecycle as lifecycle
+    from backend.database import engine
+
+    lifecycle.init_schema()
+    engine.dispose()
+    os.environ["DB_INIT_ON_STARTUP"] = "false"  # spawned workers read it from the environment
+    lifecycle.DB_INIT_ON_STARTUP = False  # workers forked from this process (or a single in-process worker)
+
+
+def run_uvicorn(args):
+    import uvicorn
+
+    # With more than one worker uvicorn spawns fresh processes that import the app themselves
+    uvicorn.run(
+        APP,
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        proxy_headers=True,
+        forwarded_allow_ips=args.forwarded_allow_ips,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        log_level=args.log_level,
+    )
+
+
+def run_gunicorn(args):
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        raise SystemExit("gunicorn is not installed: pip install gunicorn (not available on Windows)")
+
+    class Application(BaseApplication):
+        def load_config(self):
+            options = {
+                "bind": f"{args.host}:{args.port}",
+                "workers": args.workers,
+                "worker_class": "uvicorn.workers.UvicornWorker",
+                # Import the app once in the master and fork it: workers share the imported code
+                # pages (copy on write) and start without re-importing everything
+                "preload_app": True,
+                "graceful_timeout": args.graceful_timeout,
+                "forwarded_allow_ips": args.forwarded_allow_ips,
+                "loglevel": args.log_level,
+                # Restart workers now and then so slow leaks can't pile up
+                "max_requests": args.max_requests,
+                "max_requests_jitter": args.max_requests // 10,
+            }
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from backend.main import app
+            return app
+
+    Application().run()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=default_workers())
+    parser.add_argument("--gunicorn", action="store_true", help="run gunicorn with uvicorn workers and a preloaded app")
+    parser.add_argument("--graceful-timeout", type=int, default=30, help="seconds to finish running requests on shutdown")
+    parser.add_argument("--max-requests", type=int, default=0, help="gunicorn only: restart a worker after this many requests, 0 = never")
+    parser.add_argument("--forwarded-allow-ips", default=os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1"))
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--skip-init", action="store_true", help="don't create the schema, it is managed elsewhere")
+    args = parser.parse_args()
+
+    unshared = unshared_state()
+    if args.workers > 1 and unshared:
+        details = "\n".join(f"  {name}: {problem}" for name, problem in unshared)
+        raise SystemExit(f"{args.workers} workers need shared state, set these (or run one worker):\n{details}")
+
+    # Every process reads the worker count from here, e.g. logging skips the shared log file with several workers
+    os.environ["WEB_CONCURRENCY"] = str(args.workers)
+
+    if args.skip_init:
+        os.environ["DB_INIT_ON_STARTUP"] = "false"
+    else:
+        prepare_database()
+
+    if args.gunicorn:
+        run_gunicorn(args)
+    else:
+        run_uvicorn(args)
+
+
+if __name__ == "__main__":
+    main()
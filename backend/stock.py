@@ -0,0 +1,104 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import Integer, column, insert, update, values
+from sqlalchemy.orm import Session
+
+import backend.models as models
+from backend.exceptions import AppException
+from backend.response_cache import bump_catalog_version
+
+
+# UPDATE product SET quantity = quantity + :delta, version = version + 1 WHERE id = :id AND quantity + :delta >= 0 RETURNING id, quantity
+# The check and the change happen in one statement, so two clients adjusting the same product can't lose an update
+# and stock can never go below zero.
+def _adjust_one(db: Session, product_id: int, delta: int):
+    statement = (
+        update(models.Product)
+        .where(models.Product.id == product_id, models.Product.quantity + delta >= 0)
+        .values(quantity=models.Product.quantity + delta, version=models.Product.version + 1)
+        .returning(models.Product.id, models.Product.quantity)
+    )
+    return db.execute(statement).all()
+
+
+# Same as _adjust_one but for many products in a single UPDATE ... FROM (VALUES ...) statement (Postgres only)
+def _adjust_many(db: Session, deltas: dict[int, int]):
+    changes = values(column("product_id", Integer), column("delta", Integer), name="changes").data(list(deltas.items()))
+    statement = (
+        update(models.Product)
+        .where(models.Product.id == changes.c.product_id, models.Product.quantity + changes.c.delta >= 0)
+        .values(quantity=models.Product.quantity + changes.c.delta, version=models.Product.version + 1)
+        .returning(models.Product.id, models.Product.quantity)
+    )
+    return db.execute(statement).all()
+
+
+# Apply stock changes to one or more products and record them in the ledger, all in one transaction.
+# items is a list of (product_id, delta). If any product is missing or would go below zero nothing is changed.
+# Products whose lines cancel out are left alone: no ledger row, no version bump, no cache invalidation.
+def apply_stock_adjustments(db: Session, items: list[tuple[int, int]], reason: str | None, user_id: int | None):
+    # Same product twice in a pick list -> one combined change
+    combined = {}
+    for product_id, delta in items:
+        combined[product_id] = combined.get(product_id, 0) + delta
+    deltas = {product_id: delta for product_id, delta in combined.items() if delta != 0}
+
+    unchanged = [product_id for product_id in combined if product_id not in deltas]
+    if unchanged:
+        # Still a 404 for a product that doesn't exist, like any other line
+        existing = {product_id for (product_id,) in db.query(models.Product.id).filter(models.Product.id.in_(unchanged))}
+        missing = [product_id for product_id in unchanged if product_id not in existing]
+        if missing:
+            raise AppException(f"Product(s) not found: {', '.join(map(str, missing))}", 404)
+    if not deltas:
+        return []
+
+    if db.get_bind().dialect.name == "postgresql" and len(deltas) > 1:
+        rows = _adjust_many(db, deltas)
+    else:
+        # SQLite has no UPDATE ... FROM (VALUES ...), but it is local so one statement per product is cheap
+        rows = [row for product_id, delta in deltas.items() for row in _adjust_one(db, product_id, delta)]
+
+    quantities = {row.id: row.quantity for row in rows}
+    failed = [product_id for product_id in deltas if product_id not in quantities]
+    if failed:
+        db.rollback()
+        # Only on the error path: find out which products don't exist and which just don't have enough stock
+        existing = {product_id for (product_id,) in db.query(models.Product.id).filter(models.Product.id.in_(failed))}
+        missing = [product_id for product_id in failed if product_id not in existing]
+        if missing:
+            raise AppException(f"Product(s) not found: {', '.join(map(str, missing))}", 404)
+        raise AppException(f"Insufficient stock for product(s): {', '.join(map(str, failed))}", 409)
+
+    now = datetime.now(timezone.utc)
+    movements = [
+        {
+            "product_id": product_id,
+            "delta": delta,
+            "quantity_after": quantities[product_id],
+            "reason": reason,
+            "user_id": user_id,
+            "created_at": now,
+        }
+        for product_id, delta in deltas.items()
+    ]
+    result = db.execute(
+        insert(models.StockMovement).returning(models.StockMovement.id, sort_by_parameter_order=True),
+        movements
+    )
+    for movement, (movement_id,) in zip(movements, result.all()):
+        movement["id"] = movement_id
+
+    db.commit()
+    bump_catalog_version()
+    return movements
+
+
+# Ledger entries of one product, newest first. before_id is the last id of the previous page (keyset pagination).
+# Ordered by id alone, the same key as the cursor: created_at comes from each worker's clock and can disagree
+# with the id order, while ids of one product are assigned under its row lock, in ledger order.
+def get_stock_movements(db: Session, product_id: int, limit: int, before_id: int | None = None):
+    query = db.query(models.StockMovement).filter(models.StockMovement.product_id == product_id)
+    if before_id is not None:
+        query = query.filter(models.StockMovement.id < before_id)
+    return query.order_by(models.StockMovement.id.desc()).limit(limit).all()
@@ -0,0 +1,150 @@
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+from backend.logging_config import logger
+
+load_dotenv()
+
+# Share revocations between workers/servers, e.g. redis://localhost:6379/3
+TOKEN_REVOCATION_REDIS_URL = os.getenv("TOKEN_REVOCATION_REDIS_URL")
+PRUNE_INTERVAL_SECONDS = 60
+
+
+# Revoked access tokens, checked on every authenticated request so it has to be a couple of dict lookups.
+# Two kinds of entries:
+#   token id (jti) -> its exp: one token is dead (logout)
+#   user id -> time: every token of that user issued before it is dead (role change, deletion)
+# An entry is only needed while the tokens it covers could still be valid, after that it is pruned,
+# so the set stays as small as the number of recent revocations.
+class LocalTokenRevocations:
+    def __init__(self, token_lifetime_seconds: float):
+        self.token_lifetime_seconds = token_lifetime_seconds
+        self.tokens = {}  # jti -> expires_at (unix time)
+        self.users = {}   # user_id -> revoked_before (unix time)
+        self.lock = threading.Lock()
+        self.pruned_at = time.time()
+
+    # Nothing runs in the background here, see RedisTokenRevocations
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def revoke_token(self, jti: str, expires_at: float):
+        self._add_token(jti, expires_at)
+
+    def revoke_user(self, user_id: int, before: float | None = None):
+        self._add_user(user_id, time.time() if before is None else before)
+
+    def _add_token(self, jti: str, expires_at: float):
+        with self.lock:
+            self.tokens[jti] = expires_at
+        self._prune()
+
+    def _add_user(self, user_id: int, before: float):
+        with self.lock:
+            self.users[user_id] = max(before, self.users.get(user_id, 0))
+        self._prune()
+
+    # payload is a verified token payload. Tokens from before iat was added count as issued at 0.
+    def is_revoked(self, payload: dict):
+        jti = payload.get("jti")
+        if jti is not None and jti in self.tokens:
+            return True
+        revoked_before = self.users.get(payload.get("user_id"))
+        return revoked_before is not None and payload.get("iat", 0) < revoked_before
+
+    def _prune(self):
+        now = time.time()
+        if now - self.pruned_at < PRUNE_INTERVAL_SECONDS:
+            return
+        with self.lock:
+            self.pruned_at = now
+            self.tokens = {jti: expires_at for jti, expires_at in self.tokens.items() if expires_at > now}
+            oldest = now - self.token_lifetime_seconds
+            self.users = {user_id: before for user_id, before in self.users.items() if before > oldest}
+
+    def __len__(self):
+        return len(self.tokens) + len(self.users)
+
+
+# Shared backend for multi-worker deployments. Needs: pip install redis
+# Checks stay in process memory: a revocation is stored in Redis (so workers that start later load it)
+# and published, and a listener thread in every worker adds it to its own set.
+# The listener is started by start(), from the lifespan of each worker: a thread started at import would only
+# run in the parent of workers forked from a preloaded app (gunicorn --preload), fork() doesn't copy it.
+class RedisTokenRevocations(LocalTokenRevocations):
+    KEY_PREFIX = "revoked:"
+    CHANNEL = "revoked"
+    POLL_SECONDS = 1  # how often the listener checks whether it should stop
+
+    def __init__(self, url: str, token_lifetime_seconds: float):
+        import redis  # optional dependency, only needed when this backend is configured
+
+        super().__init__(token_lifetime_seconds)
+        self.client = redis.Redis.from_url(url)
+        self.listener = None
+        self.stopping = threading.Event()
+
+    # Start the listener if it isn't running in this process. Safe to call more than once.
+    def start(self):
+        if self.listener is not None and self.listener.is_alive():
+            return
+        self.stopping.clear()
+        self.listener = threading.Thread(target=self._listen, name="token-revocations", daemon=True)
+        self.listener.start()
+
+    def stop(self, timeout: float = 5):
+        if self.listener is None or not self.listener.is_alive():
+            return
+        self.stopping.set()
+        self.listener.join(timeout)
+        self.listener = None
+
+    def revoke_token(self, jti: str, expires_at: float):
+        self._add_token(jti, expires_at)
+        self._share(f"token:{jti}", expires_at, expires_at - time.time())
+
+    def revoke_user(self, user_id: int, before: float | None = None):
+        before = time.time() if before is None else before
+        self._add_user(user_id, before)
+        self._share(f"user:{user_id}", before, before + self.token_lifetime_seconds - time.time())
+
+    def _share(self, entry: str, value: float, ttl: float):
+        pipeline = self.client.pipeline(transaction=False)
+        pipeline.set(self.KEY_PREFIX + entry, value, ex=max(1, int(ttl) + 1))
+        pipeline.publish(self.CHANNEL, f"{entry}={value}")
+        pipeline.execute()
+
+    def _apply(self, entry: str, value: float):
+        kind, _, key = entry.partition(":")
+        if kind == "token":
+            self._add_token(key, value)
+        elif kind == "user":
+            self._add_user(int(key), value)
+
+    def _listen(self):
+        while not self.stopping.is_set():
+            pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(self.CHANNEL)
+                # Load what is stored after subscribing, so nothing published in between is missed
+                for key in self.client.scan_iter(match=self.KEY_PREFIX + "*"):
+                    value = self.client.get(key)
+                    if value is not None:
+                        self._apply(key.decode()[len(self.KEY_PREFIX):], float(value))
+
+                while not self.stopping.is_set():
+                    message = pubsub.get_message(timeout=self.POLL_SECONDS)
+                    if message is not None:
+                        entry, _, value = message["data"].decode().rpartition("=")
+                        self._apply(entry, float(value))
+            except Exception as e:
+                logger.warning(f"Token revocation listener failed, retrying: {e}")
+                self.stopping.wait(1)
+            finally:
+                pubsub.close()
@@ -0,0 +1,114 @@
+"""Auth overhead per request: verifying the bearer token, with and without the verified-token cache.
+
+Token checks are timed on their own (jwt.decode as every request used to do it, then a cache miss,
+a cache hit and a cache hit with a large revocation list), then as part of everything an authenticated
+request needs before its route runs (rate limit key, token payload, current user from the user cache).
+
+    python -m benchmarks.auth --calls 20000 --revoked 10000
+"""
+import argparse
+import os
+import time
+
+from benchmarks.common import add_database_arguments, benchmark_env, database_url
+
+
+def per_call(func, calls):
+    func()  # warm up
+    started = time.perf_counter()
+    for _ in range(calls):
+        func()
+    return (time.perf_counter() - started) / calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=20000, help="token verifications per measurement")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--revoked", type=int, default=10000, help="revoked tokens and users in the last measurement")
+    add_database_arguments(parser)
+    args = parser.parse_args()
+
+    os.environ.update(benchmark_env(database_url(args)))
+
+    from fastapi.security import HTTPAuthorizationCredentials
+    from jose import jwt
+    from starlette.requests import Request
+
+    import backend.auth_config as auth_config
+    import backend.models as models
+    from backend.auth_config import get_current_user, get_token_payload
+    from backend.database import session
+    from backend.rate_limit import client_key
+    from backend.token_revocation import LocalTokenRevocations
+    from benchmarks.suite import seed_database
+
+    seed_database(0, 0, seed=42)
+    db = session()
+    try:
+        admin = db.query(models.User).filter(models.User.username == "bench_admin").one()
+        token = auth_config.create_access_token({"user_id": admin.id, "username": admin.username, "role": admin.role})
+    finally:
+        db.close()
+
+    def decode_only():
+        return jwt.decode(token, auth_config.SECRET_KEY, algorithms=[auth_config.ALGORITHM])
+
+    def cache_miss():
+        auth_config.token_cache.clear()
+        return auth_config.verify_access_token(token)
+
+    def cache_hit():
+        return auth_config.verify_access_token(token)
+
+    revocations = LocalTokenRevocations(auth_config.ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+    expires_at = time.time() + 60
+    for i in range(args.revoked // 2):
+        revocations.revoke_token(f"revoked-{i}", expires_at)
+        revocations.revoke_user(admin.id + 1 + i)
+
+    print(f"{'token check':<44} {'us/call':>10}")
+    baseline = None
+    for label, func in [
+        ("jwt.decode on every request (old)", decode_only),
+        ("verify_access_token, cache miss", cache_miss),
+        ("verify_access_token, cache hit (new)", cache_hit),
+    ]:
+        seconds = per_call(func, args.calls)
+        baseline = baseline or seconds
+        print(f"{label:<44} {seconds * 1e6:10.2f}  x{baseline / seconds:.1f}")
+
+    default_revocations = auth_config.token_revocations
+    auth_config.set_token_revocations(revocations)
+    seconds = per_call(cache_hit, args.calls)
+    print(f"{f'cache hit, {len(revocations)} revocations':<44} {seconds * 1e6:10.2f}  x{baseline / seconds:.1f}")
+    auth_config.set_token_revocations(default_revocations)
+
+    # Everything an authenticated request runs before the route: the rate limiter finds the user,
+    # get_token_payload reuses that, get_current_user finds the user in the user cache
+    headers = [(b"authorization", f"Bearer {token}".encode())]
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+    def authenticate():
+        request = Request({"type": "http", "method": "GET", "path": "/users/me", "headers": headers,
+                           "query_string": b"", "client": ("127.0.0.1", 50000)})
+        client_key(request)
+        return get_current_user(request, get_token_payload(request, credentials))
+
+    print(f"\n{'auth dependencies of one request':<44} {'us/request':>10}")
+    timings = {}
+    cache_sizes = (0, auth_config.TOKEN_CACHE_MAX_SIZE or 10000)
+    for _ in range(args.repeat):  # interleaved, best of each
+        for cache_size in cache_sizes:
+            auth_config.TOKEN_CACHE_MAX_SIZE = cache_size
+            auth_config.token_cache.clear()
+            seconds = per_call(authenticate, args.calls)
+            timings[cache_size] = min(timings.get(cache_size, seconds), seconds)
+
+    old_seconds, new_seconds = timings.values()
+    print(f"{'without token cache (old)':<44} {old_seconds * 1e6:10.2f}  x1.0")
+    print(f"{'with token cache (new)':<44} {new_seconds * 1e6:10.2f}  x{old_seconds / new_seconds:.1f}")
+
+
+if __name__ == "__main__":
+    main()
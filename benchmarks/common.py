@@ -0,0 +1,87 @@
+"""Helpers shared by the benchmark scripts."""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+
+def percentile(values, percent):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def summarize(latencies, elapsed):
+    return {
+        "requests": len(latencies),
+        "rps": len(latencies) / elapsed if elapsed > 0 else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+# --database-url/--wipe for scripts that seed (and so first empty) a database. A DATABASE_URL exported
+# in the shell is never used, it may well point at real data.
+def add_database_arguments(parser, wipes: bool = True):
+    if wipes:
+        parser.add_argument("--database-url", help="run against this database instead of a fresh SQLite file. "
+                                                   "Its products, users and stock movements are DELETED (needs --wipe)")
+        parser.add_argument("--wipe", action="store_true", help="confirm that --database-url may be emptied")
+    else:
+        parser.add_argument("--database-url", help="run against this database instead of a fresh SQLite file "
+                                                   "(benchmark users and products are added to it)")
+
+
+def database_url(args):
+    if args.database_url and not getattr(args, "wipe", True):
+        raise SystemExit(f"--database-url {args.database_url} would be emptied, add --wipe if that is really what you want")
+    return args.database_url
+
+
+# Environment for a benchmark run: a fresh SQLite file unless a database_url was given explicitly.
+# BENCHMARK_DATABASE_URL marks the database seed_database is allowed to empty.
+def benchmark_env(database_url: str | None = None, **overrides):
+    env = dict(os.environ)
+    env.setdefault("SECRET_KEY", "benchmark-secret-key")
+    env["DATABASE_URL"] = database_url or f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+    env["BENCHMARK_DATABASE_URL"] = env["DATABASE_URL"]
+    env.setdefault("LOG_ACCESS", "false")  # one log line per request would dominate the numbers
+    env.setdefault("RATE_LIMIT_ENABLED", "false")  # every simulated client shares one IP and a few users
+    env.update(overrides)
+    return env
+
+
+def start_server(port: int, env: dict, workers: int = 1):
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        env=env,
+    )
+    # Wait until the server answers
+    for _ in range(200):
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/", timeout=0.5)
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("Server did not start")
+
+
+def stop_server(process):
+    process.terminate()
+    process.wait()
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
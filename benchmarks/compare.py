@@ -0,0 +1,50 @@
+"""Compare two result files written by benchmarks.suite.
+
+    python -m benchmarks.compare benchmarks/results/old.json benchmarks/results/new.json
+
+Prints throughput and p95 latency per operation with the relative change. Latency increases and
+throughput drops above --threshold percent are marked with "!".
+"""
+import argparse
+import json
+
+
+def _change(old: float, new: float):
+    return (new - old) / old * 100 if old else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=10, help="percent change that counts as a regression")
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        old = json.load(f)
+    with open(args.candidate) as f:
+        new = json.load(f)
+
+    print(f"baseline  {old['commit']}  {old['timestamp']}  mix={old['config']['mix']}")
+    print(f"candidate {new['commit']}  {new['timestamp']}  mix={new['config']['mix']}\n")
+    print(f"{'operation':<12} {'req/s old':>10} {'req/s new':>10} {'change':>8}   {'p95 old':>8} {'p95 new':>8} {'change':>8}")
+
+    regressions = 0
+    for name, row in new["endpoints"].items():
+        before = old["endpoints"].get(name)
+        if before is None:
+            continue
+        rps_change = _change(before["rps"], row["rps"])
+        p95_change = _change(before["p95_ms"], row["p95_ms"])
+        flag_rps = "!" if rps_change < -args.threshold else " "
+        flag_p95 = "!" if p95_change > args.threshold else " "
+        regressions += (flag_rps == "!") + (flag_p95 == "!")
+        print(f"{name:<12} {before['rps']:10.1f} {row['rps']:10.1f} {rps_change:+7.1f}%{flag_rps}  "
+              f"{before['p95_ms']:8.1f} {row['p95_ms']:8.1f} {p95_change:+7.1f}%{flag_p95}")
+
+    if regressions:
+        print(f"\n{regressions} value(s) changed by more than {args.threshold:g}%")
+
+
+if __name__ == "__main__":
+    main()
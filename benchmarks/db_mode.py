@@ -0,0 +1,90 @@
+"""Compare the sync (threadpool) and async (AsyncSession) DB modes under load.
+
+Starts the real app with uvicorn once per mode, seeds it, and hammers GET /products/
+with many concurrent clients. Prints requests/sec and latency percentiles.
+
+    python -m benchmarks.db_mode --clients 500 --duration 20
+    python -m benchmarks.db_mode --database-url postgresql://...
+
+Needs uvicorn, httpx and the async driver (aiosqlite or asyncpg).
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+from benchmarks.common import add_database_arguments, benchmark_env, database_url, percentile, start_server, stop_server
+
+
+async def seed(client: httpx.AsyncClient, products: int):
+    await client.post("/auth/register", json={"username": "bench_admin", "password": "bench_password", "email": "bench@example.com"})
+    response = await client.post("/auth/login", json={"username": "bench_admin", "password": "bench_password"})
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    body = "name,description,price,quantity\n" + "".join(
+        f"bench product {i},seeded for benchmark,{i % 100 + 1},{i % 50}\n" for i in range(products)
+    )
+    await client.post("/products/bulk", content=body.encode(), headers={**headers, "content-type": "text/csv"})
+    return headers
+
+
+async def run_load(base_url: str, clients: int, duration: float, products: int):
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        headers = await seed(client, products)
+        latencies = []
+        errors = 0
+        deadline = time.perf_counter() + duration
+
+        async def worker(worker_id: int):
+            nonlocal errors
+            page = worker_id % 10 + 1
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                try:
+                    response = await client.get(f"/products/?page={page}&limit=20", headers=headers)
+                    if response.status_code != 200:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(i) for i in range(clients)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "mean_ms": statistics.fmean(latencies) * 1000 if latencies else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=500)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--port", type=int, default=8765)
+    add_database_arguments(parser, wipes=False)
+    args = parser.parse_args()
+
+    for mode in ("false", "true"):
+        process = start_server(args.port, benchmark_env(database_url(args), DB_ASYNC=mode))
+        try:
+            result = asyncio.run(run_load(f"http://127.0.0.1:{args.port}", args.clients, args.duration, args.products))
+        finally:
+            stop_server(process)
+
+        name = "async" if mode == "true" else "sync"
+        print(f"{name:>5}: {result['rps']:8.1f} req/s  p50 {result['p50_ms']:7.1f} ms  p99 {result['p99_ms']:7.1f} ms  "
+              f"({result['requests']} requests, {result['errors']} errors)")
+
+
+if __name__ == "__main__":
+    main()
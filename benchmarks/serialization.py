@@ -0,0 +1,81 @@
+"""Rows/sec of the product list response path: query + validation + JSON encoding.
+
+Compares the old path (ORM objects validated one by one through response_model with
+from_attributes, then jsonable_encoder + json.dumps) with the column-projected path
+(plain rows validated with a cached TypeAdapter, or not validated and encoded with orjson).
+
+    python -m benchmarks.serialization --rows 10000 --repeat 5
+"""
+import argparse
+import json
+import os
+import time
+
+from benchmarks.common import add_database_arguments, benchmark_env, database_url
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000, help="rows per response (like a huge ?limit= or an export)")
+    parser.add_argument("--repeat", type=int, default=5)
+    add_database_arguments(parser)
+    args = parser.parse_args()
+
+    os.environ.update(benchmark_env(database_url(args)))
+
+    from fastapi.encoders import jsonable_encoder
+
+    import backend.models as models
+    from backend.database import session
+    from backend.json_response import dumps, get_adapter, orjson
+    from backend.product_query import PRODUCT_COLUMNS
+    from backend.schemas import ProductResponse
+    from benchmarks.suite import seed_database
+
+    seed_database(args.rows, 0, seed=42)
+    adapter = get_adapter(list[ProductResponse])
+
+    def orm_response_model(db):
+        products = db.query(models.Product).order_by(models.Product.id).limit(args.rows).all()
+        validated = [ProductResponse.model_validate(product) for product in products]
+        return json.dumps(jsonable_encoder(validated)).encode()
+
+    def orm_model_dump_json(db):
+        products = db.query(models.Product).order_by(models.Product.id).limit(args.rows).all()
+        return adapter.dump_json([ProductResponse.model_validate(product) for product in products])
+
+    def columns_type_adapter(db):
+        rows = db.query(*PRODUCT_COLUMNS).order_by(models.Product.id).limit(args.rows).all()
+        return adapter.dump_json(adapter.validate_python([row._asdict() for row in rows]))
+
+    def columns_trusted(db):
+        rows = db.query(*PRODUCT_COLUMNS).order_by(models.Product.id).limit(args.rows).all()
+        return dumps([row._asdict() for row in rows])
+
+    paths = [
+        ("ORM + response_model + json (old)", orm_response_model),
+        ("ORM + model_validate + dump_json", orm_model_dump_json),
+        ("columns + TypeAdapter", columns_type_adapter),
+        (f"columns + {'orjson' if orjson else 'pydantic-core'} (new)", columns_trusted),
+    ]
+
+    baseline = None
+    for label, build in paths:
+        timings = []
+        for _ in range(args.repeat + 1):
+            db = session()
+            try:
+                started = time.perf_counter()
+                body = build(db)
+                timings.append(time.perf_counter() - started)
+            finally:
+                db.close()
+        best = min(timings[1:])  # first run warms the statement cache
+        rows_per_second = args.rows / best
+        baseline = baseline or rows_per_second
+        print(f"{label:<38} {rows_per_second:12,.0f} rows/s  {best * 1000:8.1f} ms  "
+              f"{len(body) / 1024:8.0f} KiB  x{rows_per_second / baseline:.1f}")
+
+
+if __name__ == "__main__":
+    main()
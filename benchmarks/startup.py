@@ -0,0 +1,58 @@
+"""Measure worker cold start: importing the app, running its startup, and the memory it ends up using.
+
+Each sample is a fresh Python process, run once with the schema created by the worker itself
+(DB_INIT_ON_STARTUP=true, what every worker did before the launcher) and once with the schema
+already created by the parent (DB_INIT_ON_STARTUP=false, what python -m backend.server does).
+
+    python -m benchmarks.startup --runs 5
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+from benchmarks.common import benchmark_env
+
+# Runs inside the measured process
+PROBE = """
+import asyncio, json, resource, time
+started = time.perf_counter()
+from backend.main import app
+imported = time.perf_counter()
+
+async def startup():
+    async with app.router.lifespan_context(app):
+        return time.perf_counter()
+
+ready = asyncio.run(startup())
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "startup_ms": (ready - imported) * 1000,
+    "max_rss_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+}))
+"""
+
+
+def sample(env: dict):
+    output = subprocess.check_output([sys.executable, "-c", PROBE], env=env, text=True, stderr=subprocess.DEVNULL)
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    env = benchmark_env(LOG_ACCESS="false")
+    sample(env)  # create the schema once, so both modes start from an existing database
+
+    for label, init in (("init in every worker", "true"), ("init in parent", "false")):
+        runs = [sample(dict(env, DB_INIT_ON_STARTUP=init)) for _ in range(args.runs)]
+        print(f"{label:<22} import {statistics.median(r['import_ms'] for r in runs):7.1f} ms  "
+              f"startup {statistics.median(r['startup_ms'] for r in runs):7.1f} ms  "
+              f"max RSS {statistics.median(r['max_rss_mib'] for r in runs):6.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
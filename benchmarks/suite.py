@@ -0,0 +1,365 @@
+"""Load test and micro-benchmark suite for the API.
+
+Seeds a database with N products and users straight through backend.models, then drives the real
+FastAPI app with a weighted mix of requests (paged listing, listing search, ranked search, product
+detail, login, admin writes). Reports throughput and p50/p95/p99 latency per endpoint plus the
+memory allocated per request (tracemalloc), and saves everything as JSON so runs can be compared
+across commits with benchmarks.compare.
+
+    python -m benchmarks.suite                                  # in-process ASGI client, "mixed" workload
+    python -m benchmarks.suite --mix browse --products 50000 --duration 30
+    python -m benchmarks.suite --server uvicorn --workers 4     # real server, N worker processes
+    python -m benchmarks.suite --database-url postgresql://... --wipe
+
+The run is reproducible: same seed, same data, same request sequence per client.
+Without --database-url a fresh SQLite file in a temp directory is used.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import httpx
+
+from benchmarks.common import (
+    add_database_arguments, benchmark_env, database_url, git_commit, start_server, stop_server, summarize,
+)
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+PASSWORD = "bench_password"
+PAGE_LIMIT = 20
+SEARCH_TERMS = ["widget", "bolt", "cable", "steel", "blue", "pro", "mini", "kit"]
+WORDS = ["Widget", "Bolt", "Cable", "Steel", "Blue", "Pro", "Mini", "Kit", "Panel", "Sensor", "Valve", "Pump"]
+
+# Relative weights of each operation in a workload
+MIXES = {
+    "browse": {"list": 45, "list_search": 20, "get": 20, "search": 10, "stats": 3, "low_stock": 2},
+    "mixed": {"list": 30, "list_search": 15, "search": 10, "get": 15, "stats": 3, "low_stock": 2, "login": 5,
+              "create": 5, "patch": 5, "adjust": 5, "delete": 5},
+    "writes": {"create": 30, "patch": 30, "adjust": 25, "delete": 15},
+    "login": {"login": 100},
+}
+
+
+# ---------------- SEEDING ----------------
+
+# Fill the database with products and users. Must run after the benchmark environment is applied
+# to os.environ, because backend.database reads DATABASE_URL at import time.
+def seed_database(products: int, users: int, seed: int):
+    # Every product, user and stock movement is deleted below, only ever do that to the benchmark's own database
+    if os.environ.get("DATABASE_URL") != os.environ.get("BENCHMARK_DATABASE_URL"):
+        raise SystemExit("Refusing to empty a database that wasn't set up by benchmark_env")
+
+    from sqlalchemy import delete, insert
+
+    import backend.models as models
+    from backend.auth_config import hash_password
+    from backend.database import engine, session
+    from backend.enums import UserRole
+    from backend.inventory_stats import refresh_summary
+    from backend.lifecycle import init_schema
+
+    init_schema()  # the FTS and summary triggers have to exist before the rows go in
+
+    rng = random.Random(seed)
+    # Hashing is deliberately slow, one hash shared by every seeded user keeps seeding fast
+    hashed = hash_password(PASSWORD)
+
+    db = session()
+    try:
+        db.execute(delete(models.StockMovement))
+        db.execute(delete(models.Product))
+        db.execute(delete(models.User))
+
+        batch = []
+        for i in range(products):
+            name = f"{rng.choice(WORDS)} {rng.choice(WORDS)} {i}"
+            batch.append({
+                "name": name,
+                "description": f"{rng.choice(WORDS).lower()} {rng.choice(WORDS).lower()} for benchmark",
+                "price": round(rng.uniform(1, 1000), 2),
+                "quantity": rng.randint(0, 500),
+            })
+            if len(batch) == 5000:
+                db.execute(insert(models.Product), batch)
+                batch = []
+        if batch:
+            db.execute(insert(models.Product), batch)
+
+        admin = {"name": "Bench Admin", "username": "bench_admin", "hashed_password": hashed,
+                 "email": "admin@bench.local", "role": UserRole.ADMIN.value}
+        db.execute(insert(models.User), [admin] + [
+            {"name": f"Bench User {i}", "username": f"bench_user_{i}", "hashed_password": hashed,
+             "email": f"user{i}@bench.local", "role": UserRole.USER.value}
+            for i in range(users)
+        ])
+        db.commit()
+        refresh_summary(db)
+
+        first_id = db.query(models.Product.id).order_by(models.Product.id).limit(1).scalar() or 0
+    finally:
+        db.close()
+
+    return {"products": products, "users": users, "first_product_id": first_id, "dialect": engine.dialect.name}
+
+
+# ---------------- WORKLOAD ----------------
+
+class BenchState:
+    def __init__(self, data: dict, user_headers: dict, admin_headers: dict):
+        self.first_id = data["first_product_id"]
+        self.products = data["products"]
+        self.users = data["users"]
+        self.pages = max(1, min(self.products // PAGE_LIMIT, 500))  # deep offsets are a separate problem
+        self.user_headers = user_headers
+        self.admin_headers = admin_headers
+        self.created = []  # ids created by this run, used by "delete"
+        self.counter = 0
+
+    def product_id(self, rng):
+        return self.first_id + rng.randrange(max(self.products, 1))
+
+
+async def op_list(client, state, rng):
+    return await client.get("/products/", params={"page": rng.randint(1, state.pages), "limit": PAGE_LIMIT},
+                            headers=state.user_headers)
+
+
+async def op_list_search(client, state, rng):
+    return await client.get("/products/", params={"search": rng.choice(SEARCH_TERMS), "limit": PAGE_LIMIT},
+                            headers=state.user_headers)
+
+
+async def op_search(client, state, rng):
+    return await client.get("/products/search", params={"q": rng.choice(SEARCH_TERMS), "limit": PAGE_LIMIT},
+                            headers=state.user_headers)
+
+
+async def op_get(client, state, rng):
+    return await client.get(f"/products/{state.product_id(rng)}", headers=state.user_headers)
+
+
+async def op_stats(client, state, rng):
+    return await client.get("/products/stats", headers=state.user_headers)
+
+
+async def op_low_stock(client, state, rng):
+    return await client.get("/products/low-stock", params={"threshold": rng.randint(0, 20)}, headers=state.user_headers)
+
+
+async def op_login(client, state, rng):
+    username = f"bench_user_{rng.randrange(state.users)}" if state.users else "bench_admin"
+    return await client.post("/auth/login", json={"username": username, "password": PASSWORD})
+
+
+async def op_create(client, state, rng):
+    state.counter += 1
+    product = {"name": f"Bench New {rng.randrange(10**9)} {state.counter}", "description": "created by benchmark",
+               "price": round(rng.uniform(1, 100), 2), "quantity": rng.randint(0, 100)}
+    response = await client.post("/products/", json=product, headers=state.admin_headers)
+    if response.status_code == 201:
+        state.created.append(response.json()["id"])
+    return response
+
+
+async def op_patch(client, state, rng):
+    return await client.patch(f"/products/{state.product_id(rng)}", json={"price": round(rng.uniform(1, 1000), 2)},
+                              headers=state.admin_headers)
+
+
+async def op_adjust(client, state, rng):
+    return await client.post(f"/products/{state.product_id(rng)}/adjust", json={"delta": 1, "reason": "benchmark"},
+                             headers=state.admin_headers)
+
+
+async def op_delete(client, state, rng):
+    if not state.created:
+        return await op_create(client, state, rng)
+    return await client.delete(f"/products/{state.created.pop()}", headers=state.admin_headers)
+
+
+OPERATIONS = {
+    "list": ("GET /products/", op_list),
+    "list_search": ("GET /products/?search=", op_list_search),
+    "search": ("GET /products/search", op_search),
+    "get": ("GET /products/{id}", op_get),
+    "stats": ("GET /products/stats", op_stats),
+    "low_stock": ("GET /products/low-stock", op_low_stock),
+    "login": ("POST /auth/login", op_login),
+    "create": ("POST /products/", op_create),
+    "patch": ("PATCH /products/{id}", op_patch),
+    "adjust": ("POST /products/{id}/adjust", op_adjust),
+    "delete": ("DELETE /products/{id}", op_delete),
+}
+
+
+async def login_headers(client, username: str):
+    response = await client.post("/auth/login", json={"username": username, "password": PASSWORD})
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+async def run_mix(client, state, mix: dict, clients: int, duration: float, seed: int):
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    latencies = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+    deadline = time.perf_counter() + duration
+
+    async def worker(worker_id: int):
+        rng = random.Random(seed * 100003 + worker_id)
+        while time.perf_counter() < deadline:
+            name = rng.choices(names, weights)[0]
+            started = time.perf_counter()
+            try:
+                response = await OPERATIONS[name][1](client, state, rng)
+                if response.status_code >= 400:
+                    errors[name] += 1
+            except httpx.HTTPError:
+                errors[name] += 1
+            latencies[name].append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(clients)))
+    elapsed = time.perf_counter() - started
+
+    results = {}
+    for name in names:
+        results[name] = {"endpoint": OPERATIONS[name][0], **summarize(latencies[name], elapsed), "errors": errors[name]}
+    everything = [value for values in latencies.values() for value in values]
+    results["total"] = {"endpoint": "all", **summarize(everything, elapsed), "errors": sum(errors.values())}
+    return results
+
+
+# Memory allocated while serving one request, measured one request at a time with tracemalloc.
+# peak_kib is the high-water mark above the starting point, retained_kib what was still allocated afterwards.
+async def measure_allocations(client, state, mix: dict, requests: int, seed: int):
+    results = {}
+    tracemalloc.start()
+    try:
+        for name in mix:
+            rng = random.Random(seed)
+            await OPERATIONS[name][1](client, state, rng)  # warm up caches and lazy imports first
+            peaks = []
+            retained = []
+            for _ in range(requests):
+                before, _ = tracemalloc.get_traced_memory()
+                tracemalloc.reset_peak()
+                await OPERATIONS[name][1](client, state, rng)
+                after, peak = tracemalloc.get_traced_memory()
+                peaks.append(peak - before)
+                retained.append(after - before)
+            results[name] = {
+                "peak_kib": sum(peaks) / len(peaks) / 1024,
+                "retained_kib": sum(retained) / len(retained) / 1024,
+            }
+    finally:
+        tracemalloc.stop()
+    return results
+
+
+async def run_in_process(args, data):
+    from backend.main import app
+
+    # httpx does not send ASGI lifespan events, so run the app's startup/shutdown around the client ourselves
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            return await drive(client, args, data, allocations=True)
+
+
+async def run_against_server(args, data, base_url: str):
+    limits = httpx.Limits(max_connections=args.clients, max_keepalive_connections=args.clients)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        return await drive(client, args, data, allocations=False)
+
+
+async def drive(client, args, data, allocations: bool):
+    user = "bench_user_0" if data["users"] else "bench_admin"
+    state = BenchState(data, await login_headers(client, user), await login_headers(client, "bench_admin"))
+    mix = MIXES[args.mix]
+
+    if args.warmup > 0:
+        await run_mix(client, state, mix, args.clients, args.warmup, args.seed + 1)
+    results = {"endpoints": await run_mix(client, state, mix, args.clients, args.duration, args.seed)}
+
+    # Allocations of the server process can only be seen when the app runs in this process
+    if allocations and args.alloc_requests > 0:
+        for name, values in (await measure_allocations(client, state, mix, args.alloc_requests, args.seed)).items():
+            results["endpoints"][name].update(values)
+    return results
+
+
+# ---------------- OUTPUT ----------------
+
+def print_results(results: dict):
+    print(f"{'operation':<12} {'endpoint':<28} {'req':>7} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'err':>5} {'peak KiB':>9}")
+    for name, row in results["endpoints"].items():
+        peak = f"{row['peak_kib']:9.1f}" if "peak_kib" in row else f"{'-':>9}"
+        print(f"{name:<12} {row['endpoint']:<28} {row['requests']:>7} {row['rps']:9.1f} {row['p50_ms']:8.1f} "
+              f"{row['p95_ms']:8.1f} {row['p99_ms']:8.1f} {row['errors']:>5} {peak}")
+
+
+def save_results(results: dict, output: str | None):
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}_{results['commit']}_{results['config']['mix']}.json")
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    return output
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mix", choices=sorted(MIXES), default="mixed")
+    parser.add_argument("--products", type=int, default=10000)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--clients", type=int, default=50, help="concurrent clients")
+    parser.add_argument("--duration", type=float, default=10, help="seconds of measured load")
+    parser.add_argument("--warmup", type=float, default=2, help="seconds of unmeasured load before the run")
+    parser.add_argument("--alloc-requests", type=int, default=20, help="requests per operation for the allocation pass, 0 to skip")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--server", choices=["asgi", "uvicorn"], default="asgi")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes (--server uvicorn)")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--output", help="JSON file to write, default benchmarks/results/<time>_<commit>_<mix>.json")
+    add_database_arguments(parser)
+    args = parser.parse_args()
+
+    # backend reads its settings at import time, so the environment has to be in place first
+    env = benchmark_env(database_url(args), DB_INIT_ON_STARTUP="false")  # seed_database creates the schema, like the launcher does
+    os.environ.update(env)
+
+    data = seed_database(args.products, args.users, args.seed)
+    if args.server == "uvicorn":
+        process = start_server(args.port, env, workers=args.workers)
+        try:
+            results = asyncio.run(run_against_server(args, data, f"http://127.0.0.1:{args.port}"))
+        finally:
+            stop_server(process)
+    else:
+        results = asyncio.run(run_in_process(args, data))
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "database": data["dialect"],
+        "db_async": env.get("DB_ASYNC", "false"),
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        **results,
+    }
+    print_results(results)
+    print(f"\nSaved to {save_results(results, args.output)}")
+
+
+if __name__ == "__main__":
+    main()
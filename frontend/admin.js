@@ -24,6 +24,30 @@ function showToast(message, type = "danger") {
     toast.show();
 }
 
+// ---------------- PAGINATION ----------------
+// GET /users is paged with a cursor (last user id of the previous page), so we remember
+// the cursor of every page we have visited to be able to go back.
+const usersLimit = 50;
+let pageCursors = [null]; // pageCursors[i] is the cursor used to load page i + 1
+let nextCursor = null;
+const usersPrevBtn = document.getElementById("usersPrevBtn");
+const usersNextBtn = document.getElementById("usersNextBtn");
+const usersPageInfo = document.getElementById("usersPageInfo");
+
+usersPrevBtn.addEventListener("click", () => {
+    if (pageCursors.length > 1) {
+        pageCursors.pop();
+        loadUsers();
+    }
+});
+
+usersNextBtn.addEventListener("click", () => {
+    if (nextCursor !== null) {
+        pageCursors.push(nextCursor);
+        loadUsers();
+    }
+});
+
 async function loadUsers() {
     // Show loading spinner while fetching
     tableBody.innerHTML = `
@@ -36,7 +60,12 @@ async function loadUsers() {
     `;
 
     try {
-        const res = await fetch(API_USERS, {
+        // Reloads the current page (e.g. after a role change or delete)
+        const cursor = pageCursors[pageCursors.length - 1];
+        let url = `${API_USERS}/?limit=${usersLimit}`;
+        if (cursor !== null) url += `&cursor=${cursor}`;
+
+        const res = await fetch(url, {
             headers: {
                 "Authorization": `Bearer ${getToken()}`
             }
@@ -52,8 +81,14 @@ async function loadUsers() {
             throw new Error(`Failed to load users (${res.status})`);
         }
 
-        const users = await res.json();
-        renderUsersTable(users);
+        const data = await res.json(); // { items, limit, has_more, next_cursor }
+        renderUsersTable(data.items);
+
+        // Update Pagination UI
+        nextCursor = data.next_cursor;
+        usersPageInfo.textContent = `Page ${pageCursors.length}`;
+        usersPrevBtn.disabled = pageCursors.length === 1;
+        usersNextBtn.disabled = !data.has_more;
     } catch (error) {
         console.error("Error loading users:", error);
         showToast(error.message || "Failed to load users", "danger");
@@ -168,7 +203,15 @@ async function deleteUser(id, btn) {
 }
 
 // Quick setup for Theme and Logout
-document.getElementById("logoutBtn").addEventListener("click", () => {
+// Revoke the token on the server too, so a copy of it stops working now and not when it expires
+// const API_LOGOUT = "http://127.0.0.1:8000/auth/logout";
+const API_LOGOUT = "https://inventory-management-system-cjr4.onrender.com/auth/logout";
+document.getElementById("logoutBtn").addEventListener("click", async () => {
+    try {
+        await fetch(API_LOGOUT, { method: "POST", headers: { "Authorization": `Bearer ${getToken()}` } });
+    } catch (error) {
+        // Offline or server down: the token still expires on its own
+    }
     localStorage.removeItem("token");
     localStorage.removeItem("role");
     window.location.href = "login.html";
@@ -32,6 +32,7 @@ const editQty = document.getElementById("editQty");
 let products = [];
 let searchQuery = "";
 let currentPage = 1;
+let hasMore = false;
 const limit = 10;
 const prevBtn = document.getElementById("prevBtn");
 const nextBtn = document.getElementById("nextBtn");
@@ -221,14 +222,16 @@ async function loadProducts(page = 1) {
             throw new Error(errData?.message || handleError(null, res.status)); // Optional chaining (?.) safely attempts to read message. If errData is null, it gracefully returns undefined without crashing.
         } 
 
-        products = await res.json();
+        const data = await res.json(); // { items, page, limit, has_more, next_cursor, total }
+        products = data.items;
         renderTable(products);
         console.log("Products loaded:", products);
 
         // Update Pagination UI
         pageInfo.textContent = `Page ${currentPage}`;
         prevBtn.disabled = currentPage === 1;
-        nextBtn.disabled = products.length < limit; // Disable next if we didn't get a full page of results
+        hasMore = data.has_more;
+        nextBtn.disabled = !hasMore; // Backend tells us if there is another page
     } catch (error) {
         console.error("Error loading products:", error);
         showToast("Failed to load products: " + handleError(error, null), "danger");
@@ -367,7 +370,7 @@ document.querySelector("#productForm").addEventListener("submit", async (e) => {
         console.log("Product created:", newProduct);
         showToast("Product added successfully", "success");
         e.target.reset(); 
-        loadProducts(currentPage); // Reload current page to preserve UI state
+        loadProducts(currentPage); // Reload current page to preserve UI state (don't wait for the live feed, it may be down or on another worker)
 
         // Auto-close form on mobile screens (less than 768px)
         if (window.innerWidth < 768) {
@@ -446,7 +449,7 @@ async function updateProduct() {
         showToast("Product updated successfully", "success");
         
         closeModal();
-        loadProducts(currentPage);
+        applyChange("product.updated", updatedProduct); // the response is the saved product, no need to wait for the live feed
 
     } catch (error) {
         console.error("Error updating product:", error);
@@ -573,12 +576,83 @@ themeToggle.addEventListener("click", () => { // When the theme toggle button is
 
 
 // ---------------- LOGOUT ----------------
-document.getElementById("logoutBtn").addEventListener("click", () => {
+// Revoke the token on the server too, so a copy of it stops working now and not when it expires
+// const API_LOGOUT = "http://127.0.0.1:8000/auth/logout";
+const API_LOGOUT = "https://inventory-management-system-cjr4.onrender.com/auth/logout";
+document.getElementById("logoutBtn").addEventListener("click", async () => {
+    try {
+        await fetch(API_LOGOUT, { method: "POST", headers: { "Authorization": `Bearer ${getToken()}` } });
+    } catch (error) {
+        // Offline or server down: the token still expires on its own
+    }
     localStorage.removeItem("token"); 
     localStorage.removeItem("role"); 
     window.location.href = "login.html"; 
 });
 
+// ---------------- LIVE UPDATES ----------------
+// Changes made by others arrive from GET /products/changes (Server-Sent Events) and are applied to the table.
+// Our own writes update the table from their response, so they show up even when the feed misses them.
+// fetch() is used instead of EventSource because EventSource can't send the Authorization header.
+let lastEventId = null; // sent back on reconnect so the server replays what we missed
+
+function applyChange(event, data) {
+    const index = products.findIndex(p => p.id === data.id);
+
+    if (event === "product.updated") {
+        if (index === -1) return; // not on this page
+        products[index] = { ...products[index], ...data }; // stock changes only send id and quantity
+        renderTable(products);
+    } else if (event === "product.deleted") {
+        if (index !== -1) loadProducts(currentPage); // refill the page
+    } else if (event === "product.created") {
+        if (!hasMore && !searchQuery) loadProducts(currentPage); // products are listed by id, a new one lands on the last page
+    } else {
+        loadProducts(currentPage); // products.reload (bulk import) or reset (we missed events)
+    }
+}
+
+async function watchProducts() {
+    try {
+        const headers = { "Authorization": `Bearer ${getToken()}` };
+        if (lastEventId) headers["Last-Event-ID"] = lastEventId;
+
+        const res = await fetch(`${API}/changes`, { headers });
+        if (res.status === 401) return; // token expired, loadProducts() sends the user to the login page
+        if (!res.ok) throw new Error(handleError(null, res.status));
+
+        const reader = res.body.pipeThrough(new TextDecoderStream()).getReader();
+        let buffer = "";
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += value;
+
+            // Events are separated by a blank line
+            let end;
+            while ((end = buffer.indexOf("\n\n")) !== -1) {
+                const frame = buffer.slice(0, end);
+                buffer = buffer.slice(end + 2);
+
+                let event = null;
+                let data = "";
+                for (const line of frame.split("\n")) {
+                    if (line.startsWith("id: ")) lastEventId = line.slice(4);
+                    else if (line.startsWith("event: ")) event = line.slice(7);
+                    else if (line.startsWith("data: ")) data += line.slice(6);
+                }
+                if (event) applyChange(event, JSON.parse(data)); // lines starting with ":" are heartbeats
+            }
+        }
+    } catch (error) {
+        console.error("Live updates disconnected:", error);
+    }
+
+    setTimeout(watchProducts, 3000); // reconnect and resume from lastEventId
+}
+
 // ---------------- INIT ----------------
 loadProducts();
+watchProducts();
 console.log("App started...");
\ No newline at end of file